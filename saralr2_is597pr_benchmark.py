@@ -0,0 +1,293 @@
+"""
+Benchmarks for the library computer utilization simulation
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+Times the simulation's hot paths over a sweep of patron volume (400 to 10,000 patrons per day), fleet size, hours
+open and number of days, and records wall time, days per second and peak memory to a JSON file:
+    python saralr2_is597pr_benchmark.py run --suite quick --output benchmark_before.json
+    python saralr2_is597pr_benchmark.py run --suite quick --output benchmark_after.json
+    python saralr2_is597pr_benchmark.py compare benchmark_before.json benchmark_after.json
+compare exits with status 1 if any benchmark got slower or used more memory than the threshold allows.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import saralr2_is597pr_final as sim
+
+
+ENGINES = {'run_one_day': sim.run_one_day, 'run_one_day_events': sim.run_one_day_events}
+
+
+def bench_patrons_per_minute(total_patrons: int, rng: np.random.Generator):
+    """
+    :param total_patrons: Patrons per day
+    :param rng: NumPy random Generator
+    :return: Function to time, and the # of days one call simulates (None: not a whole day)
+    """
+    return lambda: sim.patrons_per_minute(total_patrons, rng=rng), None
+
+
+def patron_table(total_patrons: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    :param total_patrons: Patrons per day
+    :param rng: NumPy random Generator
+    :return: Patron dataframe as run_one_day() builds it, before any patron got a computer
+    """
+    df = pd.DataFrame(sim.patrons_per_minute(total_patrons, rng=rng), columns=['Arrival_minute'])
+    df = df.sort_values(['Arrival_minute'])
+    for column in ['Got_computer_minute', 'Leave_minute', 'Wait_duration', 'Departed_queue']:
+        df[column] = np.nan
+    return df
+
+
+def bench_update_one_patron(total_patrons: int, rng: np.random.Generator):
+    """
+    One computer assignment at the busiest minute, on a patron table of total_patrons rows.
+    """
+    df = patron_table(total_patrons, rng)
+    minute = int(df['Arrival_minute'].mode()[0])    # Busiest minute, so there are simultaneous arrivals to pick from
+    duplicates = df[df.duplicated(subset='Arrival_minute', keep=False)]
+    return lambda: sim.update_one_patron(df, duplicates, minute, rng), None
+
+
+def bench_update_one_or_more_patrons(total_patrons: int, rng: np.random.Generator):
+    """
+    Assigning every patron who arrived at the busiest minute, on a patron table of total_patrons rows.
+    """
+    df = patron_table(total_patrons, rng)
+    minute = int(df['Arrival_minute'].mode()[0])
+    return lambda: sim.update_one_or_more_patrons(df, minute, rng), None
+
+
+def bench_run_one_day(engine: str, fleet: int, total_patrons: int, hours_open: int, rng: np.random.Generator):
+    """
+    One day of either engine with a fixed number of patrons.
+    """
+    return lambda: ENGINES[engine](fleet, hours_open, rng, total_patrons=total_patrons), 1
+
+
+def bench_run_simulation(engine: str, fleets: list, number_of_days: int, rng: np.random.Generator):
+    """
+    A whole seeded run_simulation(), including the aggregate tables.
+    """
+    seed = int(rng.integers(2 ** 32))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):     # Keep the progress prints out of the report
+            sim.run_simulation(fleets, number_of_days, engine=ENGINES[engine], seed=seed)
+    return run, number_of_days * len(fleets)
+
+
+BENCHMARKS = {
+    'patrons_per_minute': bench_patrons_per_minute,
+    'update_one_patron': bench_update_one_patron,
+    'update_one_or_more_patrons': bench_update_one_or_more_patrons,
+    'run_one_day': bench_run_one_day,
+    'run_simulation': bench_run_simulation,
+}
+
+
+def sweep(benchmark: str, **values) -> list:
+    """
+    Every combination of the parameter values given.
+
+    >>> sweep('run_one_day', engine=['run_one_day_events'], fleet=[75, 155], total_patrons=[400], hours_open=[10])     # doctest: +NORMALIZE_WHITESPACE
+    [('run_one_day', {'engine': 'run_one_day_events', 'fleet': 75, 'total_patrons': 400, 'hours_open': 10}),
+     ('run_one_day', {'engine': 'run_one_day_events', 'fleet': 155, 'total_patrons': 400, 'hours_open': 10})]
+    """
+    return [(benchmark, dict(zip(values, combination))) for combination in itertools.product(*values.values())]
+
+
+def suite_cases(suite: str = 'quick') -> list:
+    """
+    :param suite: 'quick' (a minute or two) or 'full' (the whole sweep, including the original engine at 10,000 patrons)
+    :return: List of (benchmark name, params) to run
+    """
+    if suite == 'quick':
+        volumes, fleets, hours, days = [400, 2500, 10000], [75, 155], [10], [25]
+        scan_volumes, scan_hours = [400], [10]
+    elif suite == 'full':
+        volumes, fleets, hours, days = [400, 1000, 2500, 5000, 10000], [75, 115, 155], [8, 10, 12], [25, 100, 400]
+        scan_volumes, scan_hours = volumes, hours
+    else:
+        raise ValueError("Unknown suite '" + suite + "'; choose 'quick' or 'full'")
+    return (sweep('patrons_per_minute', total_patrons=volumes)
+            + sweep('update_one_patron', total_patrons=volumes)
+            + sweep('update_one_or_more_patrons', total_patrons=volumes)
+            + sweep('run_one_day', engine=['run_one_day'], fleet=[115], total_patrons=scan_volumes, hours_open=scan_hours)
+            + sweep('run_one_day', engine=['run_one_day_events'], fleet=fleets, total_patrons=volumes, hours_open=hours)
+            + sweep('run_simulation', engine=['run_one_day_events'], fleets=[[75, 95, 115, 135, 155]], number_of_days=days))
+
+
+def case_key(benchmark: str, params: dict) -> str:
+    """
+    >>> case_key('run_one_day', {'engine': 'run_one_day_events', 'fleet': 75})
+    'run_one_day[engine=run_one_day_events,fleet=75]'
+    """
+    return benchmark + '[' + ','.join(name + '=' + str(value) for name, value in params.items()) + ']'
+
+
+def time_calls(run, calls: int) -> float:
+    """
+    :param run: Function to time
+    :param calls: # of calls in a row
+    :return: Wall time per call in seconds
+    """
+    start = time.perf_counter()
+    for call in range(calls):
+        run()
+    return (time.perf_counter() - start) / calls
+
+
+def measure(run, days: int = None, repeats: int = 3, min_time: float = 0.2) -> dict:
+    """
+    Time a function, then run it once more under tracemalloc for its peak memory (tracing slows it down, so that run
+    is not timed). Like timeit's autorange, fast functions are called 1, 10, 100... times in a row until one repeat
+    takes at least min_time, so millisecond timings are not lost in timer and scheduler noise.
+
+    :param run: Function to time
+    :param days: # of simulated days per call, for days/second; None if the function does not simulate whole days
+    :param repeats: # of timed repeats
+    :param min_time: Shortest wall time, in seconds, for one repeat
+    :return: Dict of median and min wall time per call in seconds, days per second and peak memory in bytes
+
+    >>> result = measure(lambda: sum(range(1000)), days=1, min_time=0.01)
+    >>> sorted(result)
+    ['calls_per_repeat', 'days_per_second', 'peak_memory_bytes', 'repeats', 'wall_time_min_s', 'wall_time_s']
+    >>> result['calls_per_repeat'] > 1
+    True
+    """
+    calls = 1
+    first = time_calls(run, calls)      # Also warms up caches and lazy imports
+    while first * calls < min_time:
+        calls *= 10
+        first = time_calls(run, calls)
+    times = [first] + [time_calls(run, calls) for repeat in range(repeats - 1)]
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    wall_time = statistics.median(times)
+    return {'repeats': repeats,
+            'calls_per_repeat': calls,
+            'wall_time_s': wall_time,
+            'wall_time_min_s': min(times),
+            'days_per_second': None if days is None else days / wall_time,
+            'peak_memory_bytes': peak}
+
+
+def run_benchmarks(cases: list, repeats: int = 3, seed: int = 597, select: str = None) -> dict:
+    """
+    :param cases: List of (benchmark name, params), e.g. from suite_cases()
+    :param repeats: # of timed calls per case
+    :param seed: Root seed, so every run of the suite simulates the same days
+    :param select: Optional substring; only cases whose key contains it are run
+    :return: Dict ready to save as JSON: the environment and one result per case
+    """
+    results = []
+    for benchmark, params in cases:
+        key = case_key(benchmark, params)
+        if select is not None and select not in key:
+            continue
+        run, days = BENCHMARKS[benchmark](rng=np.random.default_rng(seed), **params)
+        result = measure(run, days, repeats)
+        results.append(dict(key=key, benchmark=benchmark, params=params, **result))
+        rate = '' if days is None else ', {:.1f} days/s'.format(result['days_per_second'])
+        print('{}: {:.4f} s{}, peak {:.1f} MB'.format(key, result['wall_time_s'], rate, result['peak_memory_bytes'] / 1e6))
+    return {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.platform(),
+            'seed': seed,
+            'results': results}
+
+
+def compare(baseline: dict, candidate: dict, threshold: float = 0.2) -> pd.DataFrame:
+    """
+    Compare two benchmark runs case by case. Wall times are compared on the fastest repeat, which is the least
+    disturbed by whatever else the machine was doing.
+
+    :param baseline: Results from run_benchmarks(), e.g. before an engine change
+    :param candidate: Results from run_benchmarks(), e.g. after it
+    :param threshold: Allowed relative increase in wall time or peak memory before a case is flagged
+    :return: Dataframe with one row per case found in both runs, with time and memory ratios (candidate / baseline)
+
+    >>> before = {'results': [{'key': 'a', 'wall_time_min_s': 1.0, 'peak_memory_bytes': 100},
+    ...                       {'key': 'b', 'wall_time_min_s': 1.0, 'peak_memory_bytes': 100}]}
+    >>> after = {'results': [{'key': 'a', 'wall_time_min_s': 0.5, 'peak_memory_bytes': 100},
+    ...                      {'key': 'b', 'wall_time_min_s': 1.5, 'peak_memory_bytes': 100}]}
+    >>> compare(before, after)[['Time ratio', 'Memory ratio', 'Status']]     # doctest: +NORMALIZE_WHITESPACE
+         Time ratio  Memory ratio      Status
+    Key
+    a           0.5           1.0      faster
+    b           1.5           1.0  REGRESSION
+    """
+    old = {result['key']: result for result in baseline['results']}
+    rows = []
+    for result in candidate['results']:
+        if result['key'] not in old:
+            continue
+        time_ratio = result['wall_time_min_s'] / old[result['key']]['wall_time_min_s']
+        memory_ratio = result['peak_memory_bytes'] / max(old[result['key']]['peak_memory_bytes'], 1)
+        if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif time_ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = 'same'
+        rows.append([result['key'], old[result['key']]['wall_time_min_s'], result['wall_time_min_s'], time_ratio,
+                     memory_ratio, status])
+    columns = ['Key', 'Baseline time (s)', 'Candidate time (s)', 'Time ratio', 'Memory ratio', 'Status']
+    return pd.DataFrame(rows, columns=columns).set_index('Key')
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the library computer utilization simulation.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='Run a benchmark suite and save the results as JSON')
+    run.add_argument('--suite', choices=['quick', 'full'], default='quick')
+    run.add_argument('--output', default='benchmark_results.json', help='JSON file to write')
+    run.add_argument('--repeats', type=int, default=3, help='Timed calls per case')
+    run.add_argument('--seed', type=int, default=597)
+    run.add_argument('--select', help='Only run cases whose key contains this text, e.g. run_one_day_events')
+    check = commands.add_parser('compare', help='Flag regressions between two result files')
+    check.add_argument('baseline')
+    check.add_argument('candidate')
+    check.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown, 0.2 = 20%%')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_benchmarks(suite_cases(args.suite), args.repeats, args.seed, args.select)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print('Saved', len(report['results']), 'results to', args.output)
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    table = compare(baseline, candidate, args.threshold)
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 250, 'display.max_colwidth', 100):
+        print(table)
+    regressions = int((table['Status'] == 'REGRESSION').sum())
+    print(regressions, 'regression(s) out of', len(table), 'benchmarks')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
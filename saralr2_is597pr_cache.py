@@ -0,0 +1,173 @@
+"""
+On-disk result cache for the library computer utilization simulation
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+A seeded chunk of simulated days is fully determined by the engine (and its code), the inventory qty, the chunk's
+random stream, hours open and the antithetic option. ResultCache stores each chunk's daily records under a hash of
+exactly those inputs, so rerunning run_simulation() with the same seed only reads files. Asking for more days or
+another inventory qty only simulates the chunks that are missing. The model constants ($375 acquisition, $95 repair,
+the 30/70 reservation skew, the 15 to 90 minute wait tolerance) live in the code, so editing them changes the code
+hash and old results are no longer found. Least recently used files are deleted once the cache outgrows max_bytes.
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sys
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def file_hash(path: str, modified: int) -> str:
+    """
+    :param path: Source file
+    :param modified: Its modification time, so an edited file is hashed again
+    :return: SHA-256 of the file's contents
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def engine_fingerprint(engine) -> tuple:
+    """
+    Identify an engine by name, the hash of its module's source, and any functools.partial arguments (e.g. an
+    ArrivalProfile).
+
+    :param engine: Function that simulates one day, e.g. run_one_day_events
+    :return: Tuple to hash
+    """
+    args, keywords = (), {}
+    while isinstance(engine, functools.partial):
+        args = engine.args + args
+        keywords = {**engine.keywords, **keywords}
+        engine = engine.func
+    path = sys.modules[engine.__module__].__file__
+    return (engine.__module__, engine.__qualname__, file_hash(path, os.stat(path).st_mtime_ns), args,
+            sorted(keywords.items()))
+
+
+class ResultCache:
+    """
+    Content-addressed store of simulated chunks: one .npy file of daily records per (engine, inventory qty, random
+    stream, hours open, antithetic), bounded to max_bytes on disk by least-recently-used eviction.
+
+    >>> import contextlib, io, tempfile
+    >>> import saralr2_is597pr_final as sim
+    >>> cache = ResultCache(tempfile.mkdtemp())
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     first = sim.run_simulation([75, 95], 30, engine=sim.run_one_day_events, seed=597, chunk_days=10, cache=cache)
+    ...     again = sim.run_simulation([75, 95], 30, engine=sim.run_one_day_events, seed=597, chunk_days=10, cache=cache)
+    >>> print(cache.hits, cache.misses, first[0].equals(again[0]), cache.bytes_used == cache.size())
+    6 6 True True
+
+    One more inventory qty and more days: only the 4 missing chunks of 75 and 95 and the 5 chunks of 115 are simulated.
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     more = sim.run_simulation([75, 95, 115], 50, engine=sim.run_one_day_events, seed=597, chunk_days=10, cache=cache)
+    >>> print(cache.hits, cache.misses)
+    12 15
+    >>> more[0][more[0]['Inventory qty'] == 75].head(30).reset_index(drop=True).equals(first[0].head(30))
+    True
+    >>> cache.max_bytes = cache.size() // 2
+    >>> cache.evict()
+    >>> print(0 < cache.size() <= cache.max_bytes)
+    True
+    >>> cache.put(cache.key(sim.run_one_day_events, 135, np.random.SeedSequence(1), 10, False), more[0].to_records(index=False))
+    >>> print(cache.size() <= cache.max_bytes, cache.bytes_used == cache.size())
+    True True
+    """
+    def __init__(self, folder: str = '.simulation_cache', max_bytes: int = 512 * 2 ** 20):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_used = None      # Running total of size(), counted once on the first put()
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, engine, fleet: int, seed: np.random.SeedSequence, hours_open: int, antithetic: bool) -> str:
+        """
+        :param engine: Function that simulates one day
+        :param fleet: number_of_devices in the IT fleet
+        :param seed: SeedSequence of the chunk's random stream
+        :param hours_open: number of hours open per day
+        :param antithetic: Whether days are antithetic pairs
+        :return: Hex digest naming the chunk's file
+        """
+        inputs = (engine_fingerprint(engine), int(fleet), seed.entropy, tuple(seed.spawn_key), hours_open, antithetic)
+        return hashlib.sha256(pickle.dumps(inputs, protocol=4)).hexdigest()
+
+    def path(self, key: str) -> str:
+        """
+        :param key: From key()
+        :return: File the chunk is stored in
+        """
+        return os.path.join(self.folder, key + '.npy')
+
+    def get(self, key: str, number_of_days: int):
+        """
+        Days are drawn one after the other from the chunk's stream, so a longer cached chunk also answers a shorter one.
+
+        :param key: From key()
+        :param number_of_days: Number of days needed
+        :return: Array of the first number_of_days daily records, or None if they are not cached
+        """
+        try:
+            chunk = np.load(self.path(key), allow_pickle=False)
+        except (OSError, ValueError):
+            chunk = None
+        if chunk is None or len(chunk) < number_of_days:
+            self.misses += 1
+            return None
+        os.utime(self.path(key))    # Mark as recently used
+        self.hits += 1
+        return chunk[:number_of_days]
+
+    def put(self, key: str, chunk: np.ndarray):
+        """
+        Save a chunk, then evict the least recently used files if the cache is over max_bytes. The cache folder is
+        only scanned when the running total of bytes used goes over max_bytes.
+
+        :param key: From key()
+        :param chunk: Structured array of daily records
+        :return: None
+        """
+        if self.bytes_used is None:
+            self.bytes_used = self.size()
+        replaced = os.path.getsize(self.path(key)) if os.path.exists(self.path(key)) else 0
+        temporary = self.path(key) + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as file:
+            np.save(file, chunk, allow_pickle=False)
+        os.replace(temporary, self.path(key))
+        self.bytes_used += os.path.getsize(self.path(key)) - replaced
+        if self.bytes_used > self.max_bytes:
+            self.evict()
+
+    def size(self) -> int:
+        """
+        :return: Bytes used by cached chunks
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.name.endswith('.npy'))
+
+    def evict(self):
+        """
+        Delete least recently used chunks until the cache fits in max_bytes.
+        """
+        entries = sorted((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.folder) if entry.name.endswith('.npy'))
+        total = sum(size for modified, size, path in entries)
+        for modified, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+        self.bytes_used = total
+
+    def clear(self):
+        """
+        Delete every cached chunk.
+        """
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.npy'):
+                os.remove(entry.path)
+        self.bytes_used = 0
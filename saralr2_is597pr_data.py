@@ -0,0 +1,185 @@
+"""
+Calibration data loader for the library computer utilization simulation
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+The simulation's distributions come from the open data in data/:
+- Seattle Public Library laptop checkouts, one JSON array per year (5src-czff-2016..2019.json)
+- Chicago Public Library computer sessions by month, one file per year (w7uw-j3pp, 8xex-yi9w, jf4r-ngpg, fhfm-vdz3)
+Parsing the JSON takes a while, so DataCache parses it once into typed .npy columns under data/.cache/, together
+with the hour-of-day and day-of-week aggregates the simulation needs. Later loads memory-map the columns and read
+the aggregates in milliseconds. The cache is rebuilt whenever a source file's size or modification time changes.
+"""
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CHECKOUT_PATTERN = '5src-czff-*.json'
+# Chicago Public Library computer sessions by location, one Chicago Data Portal dataset per year
+SESSION_FILES = {2016: 'w7uw-j3pp.json', 2017: '8xex-yi9w.json', 2018: 'jf4r-ngpg.json', 2019: 'fhfm-vdz3.json'}
+DAYS_IN_MONTH = {'january': 31, 'february': 28, 'march': 31, 'april': 30, 'may': 31, 'june': 30, 'july': 31,
+                 'august': 31, 'september': 30, 'october': 31, 'november': 30, 'december': 31}
+# Bump when the cache layout changes, so old caches are rebuilt
+CACHE_VERSION = 1
+
+
+class DataCache:
+    """
+    Typed, memory-mapped cache of the calibration data.
+
+    Columns, one entry per checkout, memory-mapped:
+    - checkout_minute: datetime64[m] checkout timestamp
+    - item_type: uint8 code into item_types
+    - year: int16 checkout year
+    Aggregates:
+    - weekday_hour_counts(): checkouts by day of the week (Monday = 0) and hour of the day
+    - year_hour_counts(): checkouts by year and hour of the day
+    - daily_counts(): checkouts per calendar day
+    - monthly_sessions() and sessions_per_day(): Chicago computer sessions by year and month
+
+    >>> data = DataCache()
+    >>> print(len(data.column('checkout_minute')), data.item_types, data.weekday_hour_counts().shape)
+    12232 ['alaptop'] (7, 24)
+    >>> int(data.weekday_hour_counts().sum(axis=0).argmax())   # The 15:00 hour is the busiest
+    15
+    """
+    def __init__(self, data_dir: str = DATA_DIR, cache_dir: str = None):
+        self.data_dir = data_dir
+        self.cache_dir = os.path.join(data_dir, '.cache') if cache_dir is None else cache_dir
+        self.manifest = None
+        if not self.is_current():
+            self.build()
+        with open(os.path.join(self.cache_dir, 'manifest.json')) as file:
+            self.manifest = json.load(file)
+        self.item_types = self.manifest['item_types']
+
+    def sources(self) -> list:
+        """
+        :return: Sorted paths of every source file the cache is built from
+        """
+        checkouts = glob.glob(os.path.join(self.data_dir, CHECKOUT_PATTERN))
+        sessions = [os.path.join(self.data_dir, name) for name in SESSION_FILES.values()]
+        return sorted(checkouts + [path for path in sessions if os.path.exists(path)])
+
+    def signature(self) -> dict:
+        """
+        :return: {file name: [size in bytes, modification time in ns]} for every source file
+        """
+        return {os.path.basename(path): [os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in self.sources()}
+
+    def is_current(self) -> bool:
+        """
+        :return: True if the cache exists and was built from the source files as they are now
+        """
+        try:
+            with open(os.path.join(self.cache_dir, 'manifest.json')) as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return manifest.get('version') == CACHE_VERSION and manifest.get('sources') == self.signature()
+
+    def build(self):
+        """
+        Parse the source files and write the columns, aggregates and manifest. The manifest is written last, so an
+        interrupted build is simply rebuilt next time.
+        """
+        paths = sorted(glob.glob(os.path.join(self.data_dir, CHECKOUT_PATTERN)))
+        if not paths:
+            raise FileNotFoundError("No checkout data matches " + os.path.join(self.data_dir, CHECKOUT_PATTERN))
+        records = []
+        for path in paths:
+            with open(path) as file:
+                records.extend(json.load(file))
+        timestamps = np.array([record['checkoutdatetime'] for record in records], dtype='datetime64[ms]')
+        item_types, item_codes = np.unique([record['itemtype'] for record in records], return_inverse=True)
+        columns = {'checkout_minute': timestamps.astype('datetime64[m]'),
+                   'item_type': item_codes.astype(np.uint8),
+                   'year': np.array([record['checkoutyear'] for record in records], dtype=np.int16)}
+
+        minutes = columns['checkout_minute'].astype(np.int64)
+        days = minutes // (24 * 60)
+        hours = minutes // 60 % 24
+        weekdays = (days + 3) % 7      # 1970-01-01 was a Thursday
+        years = np.unique(columns['year'])
+        dates, day_counts = np.unique(days, return_counts=True)
+        aggregates = {'weekday_hour_counts': np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24),
+                      'years': years,
+                      'year_hour_counts': np.bincount(np.searchsorted(years, columns['year']) * 24 + hours,
+                                                      minlength=len(years) * 24).reshape(len(years), 24),
+                      'dates': dates.astype('datetime64[D]'),
+                      'day_counts': day_counts}
+
+        session_years, sessions = [], []
+        for year, name in SESSION_FILES.items():
+            path = os.path.join(self.data_dir, name)
+            if os.path.exists(path):
+                with open(path) as file:
+                    rows = json.load(file)
+                session_years.append(year)
+                sessions.append([sum(int(row[month]) for row in rows) for month in DAYS_IN_MONTH])
+        aggregates['session_years'] = np.array(session_years, dtype=np.int16)
+        aggregates['monthly_sessions'] = np.array(sessions, dtype=np.int64).reshape(len(session_years), 12)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name, values in {**columns, **aggregates}.items():
+            np.save(os.path.join(self.cache_dir, name + '.npy'), values, allow_pickle=False)
+        manifest = {'version': CACHE_VERSION, 'sources': self.signature(), 'item_types': item_types.tolist(),
+                    'rows': len(records)}
+        with open(os.path.join(self.cache_dir, 'manifest.json'), 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        :param name: 'checkout_minute', 'item_type' or 'year'
+        :return: Read-only memory-mapped array, one entry per checkout
+        """
+        return np.load(os.path.join(self.cache_dir, name + '.npy'), mmap_mode='r')
+
+    def aggregate(self, name: str) -> np.ndarray:
+        """
+        :param name: Name of a precomputed aggregate array
+        :return: The array, loaded into memory
+        """
+        return np.load(os.path.join(self.cache_dir, name + '.npy'))
+
+    def weekday_hour_counts(self) -> np.ndarray:
+        """
+        :return: Array shaped (7, 24) of checkouts: Monday = row 0, midnight = column 0
+        """
+        return self.aggregate('weekday_hour_counts')
+
+    def year_hour_counts(self) -> pd.DataFrame:
+        """
+        :return: Dataframe of checkouts, one row per year and one column per hour of the day
+        """
+        return pd.DataFrame(self.aggregate('year_hour_counts'), index=pd.Index(self.aggregate('years'), name='year'))
+
+    def daily_counts(self) -> pd.Series:
+        """
+        :return: Checkouts per calendar day, for days with at least one checkout
+        """
+        return pd.Series(self.aggregate('day_counts'), index=pd.DatetimeIndex(self.aggregate('dates'), name='day'))
+
+    def monthly_sessions(self) -> pd.DataFrame:
+        """
+        :return: Chicago Public Library computer sessions, one row per year and one column per month
+        """
+        return pd.DataFrame(self.aggregate('monthly_sessions'), columns=list(DAYS_IN_MONTH),
+                            index=pd.Index(self.aggregate('session_years'), name='year'))
+
+    def sessions_per_day(self) -> pd.DataFrame:
+        """
+        Approximate sessions per day: total sessions per month / number of days in the month, as in
+        saralr2_is597pr_chicago_analysis.ipynb. The basis of set_total_patrons_count().
+
+        :return: Dataframe of ints, one row per year and one column per month
+
+        >>> spd = DataCache().sessions_per_day()
+        >>> print(spd.shape, spd.values.min(), spd.values.max())
+        (4, 12) 514 949
+        """
+        return (self.monthly_sessions() / pd.Series(DAYS_IN_MONTH)).astype('int64')
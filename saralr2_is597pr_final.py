@@ -4,12 +4,29 @@ Sara Rasmussen (saralr2)
 IS597PR
 Fall 2020
 """
+import argparse
 import random
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
-from collections import Counter
+from collections import Counter, deque
+import bisect
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import heapq
+import json
+import statistics
+import sys
+import time
+from saralr2_is597pr_data import DataCache
+from saralr2_is597pr_sinks import open_sink, SINKS
+from saralr2_is597pr_plots import show_histogram
+
+# 375 = Your average Chromebook price; Acquisition is a fixed cost based on the number of devices in inventory; Ignore bulk pricing models
+ACQUISITION_COST = 375
+# Repair fee: $95 (2 hours to collect, re-image, return a computer * median(DOIS help desk tech $40-55/hr wage)) (Source: Chicago Data Portal)
+REPAIR_COST = 95
 
 
 def calculate_pert(low, likely, high, weight=4) -> float:
@@ -32,7 +49,7 @@ def calculate_pert(low, likely, high, weight=4) -> float:
     return pert
 
 
-def determine_fleet_availability(total_inventory: int) -> int:
+def determine_fleet_availability(total_inventory: int, n: int = None, rng: np.random.Generator = None) -> int:
     """
     RANDOMIZED VARIABLE:
     Given the number of computers in your fleet, calculate out-of-service count, return the number of computers in service today.
@@ -41,58 +58,94 @@ def determine_fleet_availability(total_inventory: int) -> int:
     MTBF can be calculated as the arithmetic mean (average) time between failures of a system." (Source: Wikipedia)
     Average laptop failure rate after 2 years = 19%; after 3 years = 31% (Source: Sands and Tseng)
 
-    :total_inventory: The number of computers in your inventory. Must be an int.
+    :total_inventory: The number of computers in your inventory. Must be an int, or an array of n ints when n is given.
     :Weight: Default value is 4; the amount of likelihood that the middle point will be true.
+    :n: Optional number of days to draw at once; returns an array of n values instead of an int
+    :rng: Optional NumPy random Generator to draw from; the random module is used if None
     :return: The number (int) of computers available to be used today
 
     >>> determine_fleet_availability(153)
     145
+    >>> fleet = determine_fleet_availability(153, n=1000, rng=np.random.default_rng(597))
+    >>> print(fleet.shape, fleet.min() >= 153 - int(153 * calculate_pert(0, .04, .31)), fleet.max() <= 153 - int(153 * calculate_pert(0, .04, .19)))
+    (1000,) True True
     """
     best_case = 0.00
     likely_case = 0.04
-    worst_case = random.uniform(0.19, 0.31)
+    if n is not None:
+        rng = np.random.default_rng() if rng is None else rng
+        pct_out = calculate_pert(best_case, likely_case, rng.uniform(0.19, 0.31, n))
+        return total_inventory - (total_inventory * pct_out).astype(np.int64)
+    if rng is None:
+        worst_case = random.uniform(0.19, 0.31)
+    else:
+        worst_case = rng.uniform(0.19, 0.31)
     pct_out = calculate_pert(best_case, likely_case, worst_case)
     out_of_service = (total_inventory * pct_out)
     todays_inventory = total_inventory - int(out_of_service)
     return todays_inventory
 
 
-def select_reservation_length() -> int:
+def select_reservation_length(n: int = None, rng: np.random.Generator = None) -> int:
     """
     RANDOMIZED VARIABLE:
     For one computer reservation, randomly select the reservation length:
     Options for length of use selected by the patrons: 15 or 1 hour.
     Discrete distribution between two options. Not 50/50, probably skewed more like 30/70. (Source: Personal experience)
 
+    :param n: Optional number of reservations to draw at once; returns an array of n lengths instead of an int
+    :param rng: Optional NumPy random Generator to draw from; the random module is used if None
     :return: The length of time
 
     >>> reservation = select_reservation_length()
     >>> reservation in [15, 60]
     True
+    >>> reservations = select_reservation_length(10000, np.random.default_rng(597))
+    >>> print(sorted(set(reservations.tolist())), round((reservations == 15).mean(), 1))
+    [15, 60] 0.3
     """
     choices = [15, 60]
     skew = [30, 70]
+    if n is not None:
+        rng = np.random.default_rng() if rng is None else rng
+        return np.where(rng.random(n) < .3, 15, 60)
+    if rng is not None:
+        return int(rng.choice(choices, p=[.3, .7]))
     reservation = random.choices(choices, weights=skew, k=1)
     return reservation[0]
 
 
-def set_wait_length() -> int:
+def set_wait_length(n: int = None, rng: np.random.Generator = None) -> int:
     """
     RANDOMIZED VARIABLE:
     Uniform distribution of how long patrons are willing to wait.
 
+    :param n: Optional number of wait lengths to draw at once; returns an array of n ints instead of an int
+    :param rng: Optional NumPy random Generator to draw from; the random module is used if None
     :return: Int between 15 and 90
+
+    >>> waits = set_wait_length(10000, np.random.default_rng(597))
+    >>> print(waits.min(), waits.max())
+    15 89
     """
-    wait = random.uniform(15, 90)
+    if n is not None:
+        rng = np.random.default_rng() if rng is None else rng
+        return rng.uniform(15, 90, n).astype(np.int64)
+    if rng is None:
+        wait = random.uniform(15, 90)
+    else:
+        wait = rng.uniform(15, 90)
     return int(wait)
 
 
-def set_total_patrons_count(samples: int = 1) -> int:
+def set_total_patrons_count(samples: int = 1, n: int = None, rng: np.random.Generator = None) -> int:
     """
     RANDOMIZED VARIABLE:
     Set the total number of patrons for 1 day, based on Chicago Public Library data. Uses a beta distribution.
 
     :samples: Number of times to run the simulation, used for testing the distribution.
+    :n: Optional number of days to draw at once; returns an array of n ints instead of an int
+    :rng: Optional NumPy random Generator to draw from; a fresh one is created if None
     :return: An int between 444 and 821
 
     >>> results = []
@@ -102,25 +155,196 @@ def set_total_patrons_count(samples: int = 1) -> int:
     True
     >>> max(results) <= 949
     True
+    >>> days = set_total_patrons_count(n=10000, rng=np.random.default_rng(597))
+    >>> print(len(days), days.min() >= 444, days.max() <= 949)
+    10000 True True
     """
     # We cannot assume that because people have used public computers in the past, they will continue to.
     # In fact, CPL data shows that usage decreased for the last 3 years, specifically by 13.5% from 2018 to 2019.
     low_service = (514 * .865)      # I've intentionally lowered the low end by 13.5%.
     # But it's also likely that due to the economic crisis, usage will go up (Source: Jaeger et al., 2011).
-    peak_service = random.triangular((622 * .865), (949 * .865), 622)     # Triangular distribution, giving more weight to probability of lower numbers; 949 was the peak in 2016.
+    if n is not None:
+        # One peak and one beta draw per day
+        rng = np.random.default_rng() if rng is None else rng
+        peak_service = rng.triangular((622 * .865), 622, (949 * .865), n)
+        patron_pct = rng.beta(low_service, peak_service)
+        return (((peak_service - low_service) * patron_pct) + low_service).astype(np.int64)
+    if rng is None:
+        peak_service = random.triangular((622 * .865), (949 * .865), 622)     # Triangular distribution, giving more weight to probability of lower numbers; 949 was the peak in 2016.
+    else:
+        peak_service = rng.triangular((622 * .865), 622, (949 * .865))     # NumPy orders the arguments left, mode, right
     # Source: https://github.com/iSchool-597PR/Examples_Fa20/blob/master/week_07/Probability_Distributions.ipynb & https://numpy.org/doc/stable/reference/random/generated/numpy.random.Generator.beta.html
-    g = np.random.default_rng()
-    patron_pct = np.random.Generator.beta(g, low_service, peak_service, samples)
+    g = np.random.default_rng() if rng is None else rng
+    patron_pct = g.beta(low_service, peak_service, samples)
     if samples > 1:
         # Testing my distribution: Does it look like the CPL data?
         patron_array = ((peak_service - low_service) * patron_pct) + low_service
-        plt.hist(patron_array, bins=200, density=True)
-        plt.show()
+        show_histogram(patron_array)
     patron_count = ((peak_service - low_service) * patron_pct[0]) + low_service
     return int(patron_count)
 
 
-def patrons_per_minute(total_patrons: int, plot: bool = False) -> list:
+# Seattle Public Library share of laptop checkouts per hour, 10:00 to 19:00 (see saralr2_is597pr_seattle_analysis.ipynb)
+SEATTLE_HOURLY_SHARES = [0.035010, 0.045726, 0.055542, 0.136442, 0.165399, 0.223067, 0.199427, 0.088998, 0.047607, 0.002781]
+
+
+class ArrivalProfile:
+    """
+    Distribution of patron arrivals over the minutes of the day: one weight per open hour, spread evenly over the
+    hour's minutes. Everything needed for sampling is computed once, when the profile is built:
+    - minute_probabilities, for multinomial counts per minute (patron_arrival_counts())
+    - cumulative weights, so random.choices() does not recompute them on every call
+    - a Vose alias table, so drawing n arrival minutes is one vectorized O(n) step
+    Source: Vose, Michael D. "A Linear Algorithm for Generating Random Numbers with a Given Distribution," IEEE
+    Transactions on Software Engineering 17(9) (1991).
+
+    >>> profile = ArrivalProfile([1, 3], opening_hour=13)
+    >>> print(profile.hours_open, profile.minutes)
+    2 120
+    >>> minutes = profile.sample(100000, np.random.default_rng(597))
+    >>> print(minutes.min(), minutes.max(), round(float((minutes >= 60).mean()), 2))
+    0 119 0.75
+    >>> profile.with_hours(4).hourly_weights.round(3).tolist()
+    [0.125, 0.125, 0.375, 0.375]
+    """
+    def __init__(self, hourly_weights, opening_hour: int = 10):
+        weights = np.asarray(hourly_weights, dtype=float)
+        if weights.ndim != 1 or len(weights) == 0 or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError("hourly_weights must be one non-negative weight per open hour, not all zero")
+        self.hourly_weights = weights / weights.sum()
+        self.opening_hour = opening_hour
+        self.hours_open = len(weights)
+        self.minutes = self.hours_open * 60
+        self.minute_probabilities = np.repeat(self.hourly_weights, 60) / 60
+        self.cumulative = np.cumsum(self.minute_probabilities).tolist()
+        self.alias_probability, self.alias = self.alias_table(self.minute_probabilities)
+
+    @staticmethod
+    def alias_table(probabilities: np.ndarray) -> tuple:
+        """
+        Vose's alias method: split the distribution into equally likely columns, each holding at most two outcomes.
+
+        :param probabilities: Probabilities summing to 1
+        :return: Tuple of (probability of keeping the column's own outcome, alias outcome) arrays
+        """
+        columns = len(probabilities)
+        scaled = np.asarray(probabilities, dtype=float) * columns
+        keep = np.ones(columns)
+        alias = np.arange(columns)
+        small = [i for i in range(columns) if scaled[i] < 1]
+        large = [i for i in range(columns) if scaled[i] >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            keep[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        return keep, alias
+
+    def sample(self, n: int, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        Draw n arrival minutes. One uniform per patron picks the alias column (integer part) and the outcome within
+        it (fractional part), so antithetic generators mirror it too.
+
+        :param n: Number of patrons
+        :param rng: Optional NumPy random Generator; a fresh one is created if None
+        :return: Array of n arrival minutes
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        u = rng.random(n) * self.minutes
+        column = np.minimum(u.astype(np.int64), self.minutes - 1)
+        return np.where(u - column < self.alias_probability[column], column, self.alias[column])
+
+    def counts(self, total_patrons, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        :param total_patrons: Patrons per day, one int per day
+        :param rng: Optional NumPy random Generator; a fresh one is created if None
+        :return: Array shaped (days, minutes) of patrons arriving per minute
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        return rng.multinomial(np.asarray(total_patrons, dtype=np.int64), self.minute_probabilities)
+
+    def with_hours(self, hours_open: int) -> 'ArrivalProfile':
+        """
+        Stretch or squeeze the same daily shape over a different number of open hours.
+
+        :param hours_open: Number of hours open per day
+        :return: New ArrivalProfile, or this one if hours_open is unchanged
+        """
+        if hours_open == self.hours_open:
+            return self
+        cumulative = np.concatenate([[0], np.cumsum(self.hourly_weights)])
+        edges = np.linspace(0, self.hours_open, hours_open + 1)
+        return ArrivalProfile(np.diff(np.interp(edges, np.arange(self.hours_open + 1), cumulative)), self.opening_hour)
+
+    @classmethod
+    def from_checkouts(cls, weekday: int = None, opening_hour: int = 10, hours_open: int = 10) -> 'ArrivalProfile':
+        """
+        Hourly weights from the Seattle Public Library laptop checkout timestamps in data/5src-czff-*.json.
+
+        :param weekday: Optional day of the week, Monday = 0 as in pandas; all days if None
+        :param opening_hour: First open hour, 10 = 10:00
+        :param hours_open: Number of hours open per day
+        :return: ArrivalProfile
+
+        >>> int(ArrivalProfile.from_checkouts().hourly_weights.argmax())     # The 15:00 hour is the busiest
+        5
+        >>> sunday = ArrivalProfile.from_checkouts(weekday=6)
+        >>> print(sunday.hourly_weights[:3].sum(), sunday.hourly_weights[3:6].sum() > .99)    # Opens at 13:00 on Sundays
+        0.0 True
+        """
+        counts = checkout_hour_counts()
+        if weekday is not None:
+            counts = counts[weekday:weekday + 1]
+        return cls(counts[:, opening_hour:opening_hour + hours_open].sum(axis=0), opening_hour)
+
+
+@functools.lru_cache(maxsize=None)
+def checkout_hour_counts() -> np.ndarray:
+    """
+    Count Seattle Public Library laptop checkouts by day of the week and hour of the day, from the binary data cache
+    (see saralr2_is597pr_data.py); read once per process.
+
+    :return: Array shaped (7, 24): Monday = row 0, midnight = column 0
+    """
+    return DataCache().weekday_hour_counts()
+
+
+@functools.lru_cache(maxsize=None)
+def arrival_profile(hours_open: int = 10, weekday: int = None) -> ArrivalProfile:
+    """
+    Cached arrival profile for the simulation: the Seattle hourly shares stretched over hours_open, or, for a
+    weekday, that weekday's checkouts from 10:00.
+
+    :param hours_open: Number of hours open per day
+    :param weekday: Optional day of the week, Monday = 0
+    :return: ArrivalProfile, the same object on every call with the same arguments
+
+    >>> arrival_profile(12) is arrival_profile(12)
+    True
+    >>> print(arrival_profile(12).minutes, arrival_profile(weekday=0).hours_open)
+    720 10
+    """
+    if weekday is not None:
+        return ArrivalProfile.from_checkouts(weekday, hours_open=hours_open)
+    return ArrivalProfile(SEATTLE_HOURLY_SHARES).with_hours(hours_open)
+
+
+def arrivals_for(hours_open: int, arrivals: ArrivalProfile = None) -> ArrivalProfile:
+    """
+    :param hours_open: Number of hours open per day
+    :param arrivals: Optional ArrivalProfile; arrival_profile(hours_open) if None
+    :return: An ArrivalProfile covering exactly hours_open hours
+    """
+    arrivals = arrival_profile(hours_open) if arrivals is None else arrivals
+    if arrivals.hours_open != hours_open:
+        raise ValueError("Arrival profile covers " + str(arrivals.hours_open) + " hours, but the library is open "
+                         + str(hours_open))
+    return arrivals
+
+
+def patrons_per_minute(total_patrons: int, plot: bool = False, rng: np.random.Generator = None,
+                       arrivals: ArrivalProfile = None) -> list:
     """
     RANDOMIZED VARIABLE:
     Draw one random # representing the minute arrived, for each person.
@@ -129,7 +353,9 @@ def patrons_per_minute(total_patrons: int, plot: bool = False) -> list:
 
     :param total_patrons: Int yielded from set_total_patrons_count()
     :param plot: Optional, prints a histogram to review the distribution of patrons
-    :return: Returns a list of all hours that patrons arrived
+    :param rng: Optional NumPy random Generator to draw from; the random module is used if None
+    :param arrivals: Optional ArrivalProfile; arrival_profile() (Seattle, 10 hours) if None
+    :return: Returns a list of all minutes that patrons arrived
 
     >>> test1 = patrons_per_minute(450, plot=True)  # X-axis = Minute arrived
     >>> len(test1)      # Confirm total number of patrons that day
@@ -163,39 +389,36 @@ def patrons_per_minute(total_patrons: int, plot: bool = False) -> list:
     >>> 8 <= max_count_patrons <= 11      # Max number of patrons arriving within 1 minute between 8-11
     True
     """
-    minutes = np.arange(600)
-    probs = []
-    for i in range(600):
-        if i < 60:      # Hour 1
-            probs.append(0.035010)
-        elif i < 120:
-            probs.append(0.045726)
-        elif i < 180:
-            probs.append(0.055542)
-        elif i < 240:
-            probs.append(0.136442)
-        elif i < 300:   # Hour 5
-            probs.append(0.165399)
-        elif i < 360:
-            probs.append(0.223067)
-        elif i < 420:
-            probs.append(0.199427)
-        elif i < 480:
-            probs.append(0.088998)
-        elif i < 540:
-            probs.append(0.047607)
-        elif i < 600:   # Hour 10
-            probs.append(0.002781)
-    patron_dist = random.choices(minutes, weights=probs, k=total_patrons)
+    arrivals = arrival_profile() if arrivals is None else arrivals
+    if rng is None:
+        patron_dist = random.choices(range(arrivals.minutes), cum_weights=arrivals.cumulative, k=total_patrons)
+    else:
+        patron_dist = arrivals.sample(total_patrons, rng).tolist()
     if plot is True:
-        plt.hist(patron_dist,
-                 bins=200,
-                 density=True)
-        plt.show()
+        show_histogram(patron_dist)
     return patron_dist
 
 
-def update_one_patron(df: pd.DataFrame, subset: pd.DataFrame, minute: int) -> pd.DataFrame:
+def patron_arrival_counts(total_patrons, rng: np.random.Generator = None, arrivals: ArrivalProfile = None) -> np.ndarray:
+    """
+    RANDOMIZED VARIABLE:
+    Array counterpart of patrons_per_minute(): for many days at once, count how many patrons arrive in each minute.
+    Same Seattle Public Library distribution, drawn as one multinomial per day.
+
+    :param total_patrons: Ints yielded from set_total_patrons_count(), one per day
+    :param rng: Optional NumPy random Generator to draw from; a fresh one is created if None
+    :param arrivals: Optional ArrivalProfile; arrival_profile() (Seattle, 10 hours) if None
+    :return: Array shaped (days, minutes open) of patrons arriving per minute
+
+    >>> counts = patron_arrival_counts([450, 550], np.random.default_rng(597))
+    >>> print(counts.shape, counts.sum(axis=1), counts[:, :180].sum() / counts.sum() <= 0.20)
+    (2, 600) [450 550] True
+    """
+    arrivals = arrival_profile() if arrivals is None else arrivals
+    return arrivals.counts(total_patrons, rng)
+
+
+def update_one_patron(df: pd.DataFrame, subset: pd.DataFrame, minute: int, rng: np.random.Generator = None) -> pd.DataFrame:
     """
     Handle where more patrons arrive (within one minute) than computers available. In the real world, this might depend on whether they each made a reservation, or if not, who came first within the minute. If it was a group of kids arriving after school, they'd probably gather around and share the available computer.
     Assign computer(s) to the patron(s) with the lower index value, one at a time.
@@ -205,6 +428,7 @@ def update_one_patron(df: pd.DataFrame, subset: pd.DataFrame, minute: int) -> pd
     :param df: Patron dataframe
     :param subset: Dataframe which is a subset of df, against which to compare
     :param minute: Current minute
+    :param rng: Optional NumPy random Generator, passed on to select_reservation_length()
     :return: Updated patron dataframe
 
     >>> dummy_df = pd.DataFrame({'Arrival_minute':[1,1,10],'Got_computer_minute':[np.nan,np.nan,np.nan],'Leave_minute':[np.nan,np.nan,np.nan],'Wait_duration':[np.nan,np.nan,np.nan]})
@@ -219,17 +443,18 @@ def update_one_patron(df: pd.DataFrame, subset: pd.DataFrame, minute: int) -> pd
     small = subset['Arrival_minute'].nsmallest(n=1, keep='first').index
     if len(small) >= 1:
         df.at[small[0], 'Got_computer_minute'] = minute
-        df.at[small[0], 'Leave_minute'] = minute + select_reservation_length()
+        df.at[small[0], 'Leave_minute'] = minute + select_reservation_length(rng=rng)
         df.at[small[0], 'Wait_duration'] = minute - df.at[small[0], 'Arrival_minute']
     return df
 
 
-def update_one_or_more_patrons(df: pd.DataFrame, minute: int) -> pd.DataFrame:
+def update_one_or_more_patrons(df: pd.DataFrame, minute: int, rng: np.random.Generator = None) -> pd.DataFrame:
     """
     Find and update 1+ patrons where "Arrival_minute" = minute
 
     :param df: Patron dataframe
     :param minute: Current minute
+    :param rng: Optional NumPy random Generator, passed on to select_reservation_length()
     :return: Updated patron dataframe
 
     >>> dummy_df = pd.DataFrame({'Arrival_minute':[1,1,10],'Got_computer_minute':[np.nan,np.nan,np.nan],'Leave_minute':[np.nan,np.nan,np.nan],'Wait_duration':[np.nan,np.nan,np.nan]})
@@ -240,13 +465,155 @@ def update_one_or_more_patrons(df: pd.DataFrame, minute: int) -> pd.DataFrame:
     1               1                  1.0          ...            0.0
     2              10                  NaN           NaN            NaN
     """
-    df.loc[lambda x: x['Arrival_minute'] == minute, ['Got_computer_minute']] = minute  # Add when they got a computer
-    df.loc[lambda x: x['Arrival_minute'] == minute, ['Leave_minute']] = minute + select_reservation_length()  # Add when they plan to leave
-    df.loc[lambda x: x['Arrival_minute'] == minute, ['Wait_duration']] = minute - df['Arrival_minute']
+    arriving = df['Arrival_minute'] == minute
+    count = int(arriving.sum())
+    # Each patron picks their own reservation length, as in update_one_patron()
+    if rng is None:
+        reservations = [select_reservation_length() for patron in range(count)]
+    else:
+        reservations = select_reservation_length(count, rng)
+    df.loc[arriving, ['Got_computer_minute']] = minute  # Add when they got a computer
+    df.loc[arriving, 'Leave_minute'] = minute + np.asarray(reservations)  # Add when they plan to leave
+    df.loc[arriving, ['Wait_duration']] = 0
     return df
 
 
-def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
+class DayProfile:
+    """
+    Opt-in instrumentation for run_one_day(): wall time per phase of the minute loop, counters, and an optional
+    on_minute(minute, computers_in_use, waiting, computers_available) callback to stream per-minute state, e.g. to
+    trace_writer(). Pass one to run_one_day(profiler=...); it adds up over as many days as it is passed to.
+    Phases:
+    - Setup: daily draws and building the patron table
+    - Waiting queue reassignment: the while loops that give freed computers to waiting patrons
+    - New arrivals: update_one_or_more_patrons() when every new patron gets a computer
+    - Arrivals to a full fleet: new patrons joining the waiting queue because every computer is in use
+    - Simultaneous arrivals: the duplicated() path when more patrons arrive than computers are free
+    - Session end: freeing computers whose reservation is over
+    - Queue abandonment: the .loc updates for patrons who stopped waiting
+    - Hourly stats: the hourly utilization and patrons waiting columns
+    - Minute callback: the on_minute callback, so a slow trace doesn't inflate the simulation's own phases
+    - Daily results: the wait duration and repair cost columns
+    Counters: Rows scanned (patron table rows read by full-table masks), Patrons assigned, Abandonments, Max queue
+    depth and Minutes.
+
+    >>> profile = DayProfile(on_minute=lambda *state: time.sleep(.001))     # A slow callback, 1 ms per minute
+    >>> day = run_one_day(75, rng=np.random.default_rng(597), profiler=profile)
+    >>> print(profile.counters['Minutes'], profile.counters['Patrons assigned'] > 0, profile.counters['Max queue depth'] > 0)
+    600 True True
+    >>> profile.report().index.tolist()      # doctest: +NORMALIZE_WHITESPACE
+    ['Setup', 'Waiting queue reassignment', 'New arrivals', 'Arrivals to a full fleet', 'Simultaneous arrivals',
+     'Session end', 'Queue abandonment', 'Hourly stats', 'Minute callback', 'Daily results']
+    >>> print(profile.seconds['Arrivals to a full fleet'] > 0, profile.seconds['Minute callback'] >= .6,
+    ...       profile.seconds['Hourly stats'] < profile.seconds['Minute callback'])
+    True True True
+    """
+    PHASES = ['Setup', 'Waiting queue reassignment', 'New arrivals', 'Arrivals to a full fleet', 'Simultaneous arrivals',
+              'Session end', 'Queue abandonment', 'Hourly stats', 'Minute callback', 'Daily results']
+
+    def __init__(self, on_minute=None):
+        self.on_minute = on_minute
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = {'Rows scanned': 0, 'Patrons assigned': 0, 'Abandonments': 0, 'Max queue depth': 0, 'Minutes': 0}
+        self.last = time.perf_counter()
+
+    def start(self):
+        """
+        Start timing the first phase.
+        """
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        """
+        Charge the time since the previous lap (or start) to a phase.
+
+        :param phase: One of PHASES
+        :return: None
+        """
+        now = time.perf_counter()
+        self.seconds[phase] += now - self.last
+        self.last = now
+
+    def report(self) -> pd.DataFrame:
+        """
+        :return: Dataframe of seconds and share of the total time per phase
+        """
+        report = pd.DataFrame({'Seconds': pd.Series(self.seconds)})
+        report['Share'] = report['Seconds'] / max(report['Seconds'].sum(), 1e-12)
+        return report
+
+
+def trace_writer(file):
+    """
+    on_minute callback for DayProfile that writes one CSV line per minute to an open text file.
+
+    :param file: Open text file, e.g. open('trace.csv', 'w')
+    :return: Callback
+
+    >>> import io
+    >>> trace = io.StringIO()
+    >>> day = run_one_day(75, rng=np.random.default_rng(597), profiler=DayProfile(on_minute=trace_writer(trace)))
+    >>> lines = trace.getvalue().splitlines()
+    >>> print(lines[0], len(lines))
+    minute,computers_in_use,waiting,computers_available 601
+    """
+    file.write('minute,computers_in_use,waiting,computers_available\n')
+
+    def on_minute(minute, computers_in_use, waiting, computers_available):
+        file.write(str(minute) + ',' + str(computers_in_use) + ',' + str(waiting) + ',' + str(computers_available) + '\n')
+    return on_minute
+
+
+@functools.lru_cache(maxsize=None)
+def daily_dtype(hours_open: int = 10, inventory: bool = True) -> np.dtype:
+    """
+    Record layout of one simulated day: the run_one_day() columns in sorted order, optionally followed by
+    'Inventory qty'. Days are stored as rows of a structured NumPy array of this dtype and only turned into a
+    DataFrame once, at the end.
+
+    :param hours_open: number of hours open per day; 10 by default
+    :param inventory: If True, end with an 'Inventory qty' field
+    :return: Structured NumPy dtype
+
+    >>> dtype = daily_dtype()
+    >>> print(len(dtype.names), dtype.names[:4], dtype.names[-1])
+    28 ('Computers available', 'Departed wait queue', 'Patrons today', 'Patrons_waiting 1') Inventory qty
+    >>> print(dtype['Utilization 1'], dtype['Repair cost'])
+    float64 int64
+    """
+    hours = [str(hour) for hour in range(1, hours_open + 1)]
+    fields = ([(name, np.int64) for name in ['Computers available', 'Departed wait queue', 'Patrons today', 'Repair cost']]
+              + [('Patrons_waiting ' + hour, np.int64) for hour in hours]
+              + [('Utilization ' + hour, np.float64) for hour in hours]
+              + [(name, np.float64) for name in ['max wait duration', 'median wait duration', 'min wait duration']])
+    fields = sorted(fields)
+    if inventory:
+        fields.append(('Inventory qty', np.int64))
+    return np.dtype(fields)
+
+
+def daily_record(daily_results: dict, hours_open: int = 10, out: np.void = None):
+    """
+    Store one day's results in a daily_dtype() record.
+
+    :param daily_results: {column: value} for every run_one_day() column
+    :param hours_open: number of hours open per day; 10 by default
+    :param out: Optional record to fill, e.g. one row of simulate_chunk()'s array
+    :return: None if out is given, else a one-row Dataframe of the run_one_day() columns in sorted order
+    """
+    if out is not None:
+        for column, value in daily_results.items():
+            out[column] = value
+        return None
+    record = np.zeros(1, daily_dtype(hours_open, inventory=False))
+    for column, value in daily_results.items():
+        record[0][column] = value
+    return pd.DataFrame(record)
+
+
+def run_one_day(fleet: int, hours_open: int = 10, rng: np.random.Generator = None, total_patrons: int = None,
+                profiler: DayProfile = None, arrivals: ArrivalProfile = None, out: np.void = None,
+                computers_available: int = None) -> pd.DataFrame:
     """
     Simulate one day at the library.
     MC sim requirement: Return all data, so that it can be analyzed in aggregate.
@@ -254,6 +621,14 @@ def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
 
     :param fleet: number_of_devices in the IT fleet
     :param hours_open: number of hours open per day; 10 by default
+    :param rng: Optional NumPy random Generator for every random draw of the day; the random module is used if None
+    :param total_patrons: Optional fixed number of patrons today, e.g. for benchmarks; set_total_patrons_count() if None
+    :param profiler: Optional DayProfile to time each phase of the day and count its work; costs nothing if None
+    :param arrivals: Optional ArrivalProfile covering hours_open hours, e.g. arrival_profile(weekday=6) for Sundays;
+                     arrival_profile(hours_open) if None
+    :param out: Optional daily_dtype() record to write the results into instead of returning a Dataframe
+    :param computers_available: Optional number of computers in service today, e.g. after spares replaced failures;
+                                determine_fleet_availability() if None
     :return: Return Dataframe shaped (1,27) with answers to the following questions: (n=hours_open)
     - How many computers were in service today?                             (dtype int)
     - What was the utilization per hour? (# computers used / # available)   (n columns with dtype float)
@@ -267,18 +642,20 @@ def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
     <BLANKLINE>
     [1 rows x 27 columns]
     """
+    if profiler is not None:
+        profiler.start()
     # Determine total number of computers and patrons today
-    computers_available = determine_fleet_availability(fleet)
-    total_patrons_today = set_total_patrons_count()
-    # Source: https://eulertech.wordpress.com/2017/11/28/pandas-valueerror-if-using-all-scalar-values-you-must-pass-an-index/
-    daily_results = pd.DataFrame.from_dict({'Patrons today': [total_patrons_today], 'Computers available': [computers_available]}, orient='columns')
+    if computers_available is None:
+        computers_available = determine_fleet_availability(fleet, rng=rng)
+    total_patrons_today = set_total_patrons_count(rng=rng) if total_patrons is None else total_patrons
+    daily_results = {'Patrons today': total_patrons_today, 'Computers available': computers_available}
     wait_count_by_hour = []
     utilization_by_hour = []
     waiting = 0
     hour = 1
 
     # For each of the patrons today, distribute the patrons' arrival minutes
-    ppm = patrons_per_minute(total_patrons_today)
+    ppm = patrons_per_minute(total_patrons_today, rng=rng, arrivals=arrivals_for(hours_open, arrivals))
     # Collect by-patron data
     patrons_df = pd.DataFrame(ppm, columns=['Arrival_minute'])
     patrons_df = patrons_df.sort_values(['Arrival_minute'])
@@ -289,7 +666,10 @@ def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
 
     # COUNT # PATRONS ARRIVED @ A PARTICULAR MINUTE
     counts = patrons_df['Arrival_minute'].value_counts()
+    wait_lengths = set_wait_length(hours_open * 60, rng)
     computers_in_use = 0
+    if profiler is not None:
+        profiler.lap('Setup')
     for minute in range(hours_open * 60):
         if minute not in counts.index.values:
             patrons_this_minute = 0
@@ -301,53 +681,79 @@ def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
             comps_free = computers_available - computers_in_use
             while comps_free > 0:
                 oldest_arrive_min = patrons_df['Arrival_minute'][(patrons_df['Got_computer_minute'].isnull() == True) & (patrons_df['Departed_queue'].isnull() == True)].min()
+                if profiler is not None:
+                    profiler.counters['Rows scanned'] += len(patrons_df)
                 if oldest_arrive_min <= minute:
                     # Update 1 patron at a time
                     nulls = patrons_df.loc[lambda x: (x['Got_computer_minute'].isnull() == True) & (x['Arrival_minute'] == oldest_arrive_min)]
-                    update_one_patron(patrons_df, nulls, minute)
+                    update_one_patron(patrons_df, nulls, minute, rng)
                     comps_free -= 1
                     computers_in_use += 1
                     waiting -= 1
+                    if profiler is not None:
+                        profiler.counters['Rows scanned'] += len(patrons_df)
+                        profiler.counters['Patrons assigned'] += 1
                 else:
                     break
+        if profiler is not None:
+            profiler.lap('Waiting queue reassignment')
         if patrons_this_minute > 0:
             comps_free = computers_available - computers_in_use
             # If a computer is unavailable, add new patrons to wait queue
             if computers_in_use == computers_available:
                 waiting += patrons_this_minute
+                if profiler is not None:
+                    profiler.lap('Arrivals to a full fleet')
             # If computers free >= patrons, add new patrons to computers in use
             elif computers_in_use < computers_available and comps_free >= patrons_this_minute:
                 computers_in_use += patrons_this_minute
                 comps_free -= patrons_this_minute
-                patrons_df = update_one_or_more_patrons(patrons_df, minute)
+                patrons_df = update_one_or_more_patrons(patrons_df, minute, rng)
+                if profiler is not None:
+                    profiler.counters['Rows scanned'] += 3 * len(patrons_df)
+                    profiler.counters['Patrons assigned'] += int(patrons_this_minute)
+                    profiler.lap('New arrivals')
             else:
                 change = 0
                 while comps_free > 0:
                     # Update got computer minute, leave minute, wait duration for 1 patron row in patron_df
-                    duplicate = patrons_df[patrons_df.duplicated(subset='Arrival_minute', keep=False)]
-                    duplicates = duplicate[duplicate['Got_computer_minute'].isnull() == True]
-                    patrons_df = update_one_patron(patrons_df, duplicates, minute)
+                    # Only patrons who arrived this minute; earlier ones are in the wait queue or already left it
+                    duplicates = patrons_df[(patrons_df['Arrival_minute'] == minute) & (patrons_df['Got_computer_minute'].isnull() == True)]
+                    patrons_df = update_one_patron(patrons_df, duplicates, minute, rng)
                     comps_free -= 1
                     computers_in_use += 1
                     change += 1
                 # change = number of patrons this minute - number of computer assignments made, add patron remainder to waiting
                 waiting += (patrons_this_minute - change)
+                if profiler is not None:
+                    profiler.counters['Rows scanned'] += change * len(patrons_df)
+                    profiler.counters['Patrons assigned'] += change
+                    profiler.lap('Simultaneous arrivals')
 
         # UPDATE QUEUE LEAVERS
         # Free up computer when patron reaches end of reservation length
-        session_end = patrons_df[patrons_df['Leave_minute'] == minute]   # Return df where Leave_minute == now
-        se = session_end['Leave_minute'].tolist()      # Turn that into a list, and see if it's been their reservation length (handles multiple patrons at 1 minute)
-        if len(se) > 0 and minute == se[0]:
-            computers_in_use -= len(se)
+        computers_in_use -= int((patrons_df['Leave_minute'].to_numpy() == minute).sum())     # Handles multiple patrons at 1 minute
+        if profiler is not None:
+            profiler.counters['Rows scanned'] += len(patrons_df)
+            profiler.lap('Session end')
         # Count people who have NOT gotten a computer AND waited over set_wait_length() minutes, 1) leave the queue, 2) set wait duration
-        wait_length = set_wait_length()
-        patrons_df.loc[lambda x: (x['Got_computer_minute'].isnull() == True) & (x['Arrival_minute'] == minute - wait_length), ['Departed_queue']] = 1
-        patrons_df.loc[lambda x: (x['Got_computer_minute'].isnull() == True) & (x['Arrival_minute'] == minute - wait_length), ['Wait_duration']] = wait_length
-        done_waiting = patrons_df['Arrival_minute'][(patrons_df['Got_computer_minute'].isnull() == True) & (patrons_df['Arrival_minute'] == minute - wait_length)].tolist()
+        wait_length = wait_lengths[minute]
+        done_waiting = []
+        if waiting > 0:     # Nobody can leave an empty queue
+            # Patrons who already left the queue are not counted again when another minute's wait length points at them
+            leaving = (patrons_df['Got_computer_minute'].isnull() == True) & (patrons_df['Departed_queue'].isnull() == True) & (patrons_df['Arrival_minute'] == minute - wait_length)
+            done_waiting = patrons_df['Arrival_minute'][leaving].tolist()
+            if done_waiting:
+                patrons_df.loc[leaving, ['Departed_queue']] = 1
+                patrons_df.loc[leaving, ['Wait_duration']] = wait_length
         if 0 < len(done_waiting) <= waiting:
             waiting -= len(done_waiting)
         elif 0 < len(done_waiting) > waiting:
             waiting = 0
+        if profiler is not None:
+            profiler.counters['Rows scanned'] += 3 * len(patrons_df)
+            profiler.counters['Abandonments'] += len(done_waiting)
+            profiler.lap('Queue abandonment')
 
         # COLLECT STATS @ END OF EACH HOUR
         if minute in range(59, (hours_open*60), 60):
@@ -357,26 +763,271 @@ def run_one_day(fleet: int, hours_open: int = 10) -> pd.DataFrame:
             daily_results["Utilization " + str(hour)] = utilization
             daily_results["Patrons_waiting " + str(hour)] = waiting
             hour += 1
+        if profiler is not None:
+            profiler.counters['Minutes'] += 1
+            profiler.counters['Max queue depth'] = max(profiler.counters['Max queue depth'], int(waiting))
+            profiler.lap('Hourly stats')
+            if profiler.on_minute is not None:
+                profiler.on_minute(minute, int(computers_in_use), int(waiting), computers_available)
+                profiler.lap('Minute callback')
 
     # UPDATE DAILY RESULTS
     daily_results['Departed wait queue'] = int(patrons_df['Departed_queue'].sum())
     daily_results['min wait duration'] = patrons_df['Wait_duration'].min()
     daily_results['median wait duration'] = patrons_df['Wait_duration'].median()
     daily_results['max wait duration'] = patrons_df['Wait_duration'].max()
-    # Repair fee: $95 (2 hours to collect, re-image, return a computer * median(DOIS help desk tech $40-55/hr wage)) (Source: Chicago Data Portal)
-    daily_results['Repair cost'] = (fleet - daily_results['Computers available']) * 95
-    # Replacing negative values with zeroes is not an ideal solution, but it will do for now.
-    daily_results = daily_results.replace(list(np.arange(-100, -1)), 0)
-    daily_results = daily_results.sort_index(axis=1)
+    # Repair fee: REPAIR_COST per computer out of service
+    daily_results['Repair cost'] = (fleet - daily_results['Computers available']) * REPAIR_COST
+    # Replacing negative values (-100 to -2) with zeroes is not an ideal solution, but it will do for now.
+    daily_results = {column: 0 if -100 <= value < -1 and value == int(value) else value
+                     for column, value in daily_results.items()}
+    daily_results = daily_record(daily_results, hours_open, out)
+    if profiler is not None:
+        profiler.lap('Daily results')
     return daily_results
 
 
-def run_simulation(inventory_qtys: list, number_of_days: int = 1) -> list:
+def run_one_day_events(fleet: int, hours_open: int = 10, rng: np.random.Generator = None,
+                       total_patrons: int = None, arrivals: ArrivalProfile = None, out: np.void = None,
+                       computers_available: int = None) -> pd.DataFrame:
+    """
+    Simulate one day at the library with an event-driven engine. Same contract and business rules as run_one_day(),
+    but without scanning the patron table every minute:
+    - Computers in use are a priority queue (min-heap) of session-end minutes, so freeing computers is a heap pop.
+    - Waiting patrons are a FIFO queue of arrival-minute cohorts, served oldest first.
+    - Abandonment deadlines work like run_one_day(): each minute one set_wait_length() is drawn, and whoever is still
+      waiting from the cohort that arrived exactly that many minutes ago leaves the queue.
+    Each patron is pushed/popped a constant number of times, so the cost is O(patrons * log(fleet)) instead of
+    O(minutes * patrons).
+
+    :param fleet: number_of_devices in the IT fleet
+    :param hours_open: number of hours open per day; 10 by default
+    :param rng: Optional NumPy random Generator for every random draw of the day
+    :param total_patrons: Optional fixed number of patrons today; set_total_patrons_count() if None
+    :param arrivals: Optional ArrivalProfile covering hours_open hours; arrival_profile(hours_open) if None
+    :param out: Optional daily_dtype() record to write the results into instead of returning a Dataframe
+    :param computers_available: Optional number of computers in service today; determine_fleet_availability() if None
+    :return: Return Dataframe shaped (1,hours_open*2+7) with the same columns as run_one_day()
+
+    >>> day = run_one_day_events(150)
+    >>> day.shape
+    (1, 27)
+    >>> list(day.columns) == list(run_one_day(150).columns)
+    True
+
+    Both engines give the same daily results. For a congested fleet (10 computers, 80 patrons a day), the means of
+    400 days here and 40 days of the much slower run_one_day() agree within .05 utilization, 1.5 patrons waiting,
+    1 departure and 3 minutes of median and max wait.
+    >>> events = pd.concat([run_one_day_events(10, total_patrons=80, rng=np.random.default_rng([day, 597])) for day in range(400)])
+    >>> scans = pd.concat([run_one_day(10, total_patrons=80, rng=np.random.default_rng([day, 597])) for day in range(40)])
+    >>> gap = (events.mean() - scans.mean()).abs()
+    >>> print(gap[['Utilization 6', 'Utilization 8']].max() < .05, gap[['Patrons_waiting 6', 'Patrons_waiting 7']].max() < 1.5)
+    True True
+    >>> print(gap['Departed wait queue'] < 1, gap[['median wait duration', 'max wait duration']].max() < 3)
+    True True
+
+    Any number of hours open, with arrivals spread over the whole day:
+    >>> long_day = run_one_day_events(75, hours_open=12, rng=np.random.default_rng(597))
+    >>> print(long_day.shape, long_day['Utilization 12'][0] > 0)
+    (1, 31) True
+    """
+    # Determine total number of computers and patrons today
+    if computers_available is None:
+        computers_available = determine_fleet_availability(fleet, rng=rng)
+    total_patrons_today = set_total_patrons_count(rng=rng) if total_patrons is None else total_patrons
+    arrival_counts = dict(enumerate(patron_arrival_counts([total_patrons_today], rng, arrivals_for(hours_open, arrivals))[0].tolist()))
+    # Pre-drawn pools: every patron gets at most one reservation, and one wait length is drawn per minute
+    reservations = iter(select_reservation_length(total_patrons_today, rng).tolist())
+    wait_lengths = set_wait_length(hours_open * 60, rng).tolist()
+    session_ends = []       # Heap of leave minutes; len(session_ends) = computers in use
+    wait_queue = deque()    # Arrival minutes of waiting cohorts, oldest first
+    cohorts = {}            # Arrival minute -> # of patrons from that minute still waiting
+    wait_durations = []
+    waiting = 0
+    departed = 0
+    daily_results = {'Patrons today': total_patrons_today, 'Computers available': computers_available}
+
+    for minute in range(hours_open * 60):
+        # UPDATE COMPUTER USAGE
+        # Before assigning new patrons to a computer, assign patrons who are waiting
+        while waiting > 0 and len(session_ends) < computers_available:
+            arrived = wait_queue[0]
+            cohort = cohorts.get(arrived, 0)
+            served = min(cohort, computers_available - len(session_ends))
+            for patron in range(served):
+                heapq.heappush(session_ends, minute + next(reservations))
+                wait_durations.append(minute - arrived)
+            waiting -= served
+            if served == cohort:    # Cohort is empty (or already left the queue)
+                wait_queue.popleft()
+                cohorts.pop(arrived, None)
+            else:
+                cohorts[arrived] = cohort - served
+        patrons_this_minute = arrival_counts.get(minute, 0)
+        if patrons_this_minute > 0:
+            served = min(patrons_this_minute, computers_available - len(session_ends))
+            for patron in range(served):
+                heapq.heappush(session_ends, minute + next(reservations))
+            wait_durations.extend([0] * served)
+            # Add patron remainder to waiting
+            if patrons_this_minute > served:
+                wait_queue.append(minute)
+                cohorts[minute] = patrons_this_minute - served
+                waiting += patrons_this_minute - served
+
+        # UPDATE QUEUE LEAVERS
+        # Free up computer when patron reaches end of reservation length
+        while session_ends and session_ends[0] <= minute:
+            heapq.heappop(session_ends)
+        # The cohort that has waited set_wait_length() minutes leaves the queue; its empty slot in wait_queue is skipped later
+        wait_length = wait_lengths[minute]
+        done_waiting = cohorts.pop(minute - wait_length, 0)
+        if done_waiting > 0:
+            waiting -= done_waiting
+            departed += done_waiting
+            wait_durations.extend([wait_length] * done_waiting)
+
+        # COLLECT STATS @ END OF EACH HOUR
+        if minute % 60 == 59:
+            hour = minute // 60 + 1
+            daily_results["Utilization " + str(hour)] = len(session_ends) / computers_available
+            daily_results["Patrons_waiting " + str(hour)] = waiting
+
+    # UPDATE DAILY RESULTS
+    daily_results['Departed wait queue'] = departed
+    if wait_durations:
+        daily_results['min wait duration'] = float(min(wait_durations))
+        daily_results['median wait duration'] = float(np.median(wait_durations))
+        daily_results['max wait duration'] = float(max(wait_durations))
+    else:
+        daily_results['min wait duration'] = np.nan
+        daily_results['median wait duration'] = np.nan
+        daily_results['max wait duration'] = np.nan
+    # Repair fee: REPAIR_COST per computer out of service
+    daily_results['Repair cost'] = (fleet - computers_available) * REPAIR_COST
+    return daily_record(daily_results, hours_open, out)
+
+
+class InverseTransformGenerator:
+    """
+    Stand-in for a NumPy random Generator that draws every variate by inverse transform from uniforms u, or from
+    1 - u when antithetic is True. Two of these built from equal seeds, one antithetic, give an antithetic pair of days:
+    where one day gets an early patron, a long reservation or a patient queue, the other gets the opposite.
+    Each method call draws from its own child stream of seed, so call k of both days lines up even when an earlier
+    call drew a different number of values (e.g. more patrons on one day).
+    Supports the methods the day engines use: random, uniform, triangular, beta, choice and multinomial.
+    Beta uses a normal approximation, which is close for the large shape parameters of set_total_patrons_count().
+
+    >>> plain = InverseTransformGenerator(np.random.SeedSequence(597))
+    >>> mirror = InverseTransformGenerator(np.random.SeedSequence(597), antithetic=True)
+    >>> print(np.allclose(plain.random(3) + mirror.random(3), 1))
+    True
+    >>> waits = plain.uniform(15, 90, 10000)
+    >>> print(15 <= waits.min(), waits.max() < 90, np.corrcoef(waits, mirror.uniform(15, 90, 10000))[0, 1] < -.99)
+    True True True
+    """
+    def __init__(self, seed: np.random.SeedSequence, antithetic: bool = False):
+        self.seed = seed
+        self.antithetic = antithetic
+
+    def random(self, size=None):
+        u = np.random.default_rng(self.seed.spawn(1)[0]).random(size)
+        return 1 - u if self.antithetic else u
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + (high - low) * self.random(size)
+
+    def triangular(self, left, mode, right, size=None):
+        u = self.random(size)
+        below = (mode - left) / (right - left)
+        variates = np.where(u < below, left + np.sqrt(u * (right - left) * (mode - left)),
+                            right - np.sqrt((1 - u) * (right - left) * (right - mode)))
+        return variates if size is not None or np.ndim(variates) else float(variates)
+
+    def beta(self, a, b, size=None):
+        u = np.clip(self.random(size if size is not None else np.shape(a + b)), 1e-12, 1 - 1e-12)
+        z = np.vectorize(statistics.NormalDist().inv_cdf)(u)
+        mean = a / (a + b)
+        sd = np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+        return mean + sd * z
+
+    def choice(self, a, size=None, p=None):
+        values = np.arange(a) if np.ndim(a) == 0 else np.asarray(a)
+        p = np.full(len(values), 1 / len(values)) if p is None else np.asarray(p)
+        cdf = np.cumsum(p) / np.sum(p)
+        picks = np.minimum(np.searchsorted(cdf, self.random(size), side='right'), len(values) - 1)
+        return values[picks]
+
+    def multinomial(self, n, pvals):
+        cdf = np.cumsum(pvals) / np.sum(pvals)
+        rows = [np.bincount(np.minimum(np.searchsorted(cdf, self.random(count), side='right'), len(cdf) - 1),
+                            minlength=len(cdf)) for count in np.atleast_1d(n)]
+        return np.array(rows) if np.ndim(n) else rows[0]
+
+
+def simulate_chunk(engine, fleet: int, number_of_days: int, seed: np.random.SeedSequence, hours_open: int = 10,
+                   antithetic: bool = False) -> np.ndarray:
+    """
+    Run number_of_days of one engine for one inventory qty. Day k draws from a Generator built from seed's child k, so
+    how many draws one day takes (run_one_day() draws a reservation per patron served) never shifts the next day.
+    This is the unit of work run_simulation() hands to worker processes.
+    With antithetic=True, days come in pairs drawn by InverseTransformGenerators from one child seed per pair,
+    the second day of each pair antithetic to the first.
+
+    :param engine: Function that simulates one day and writes it to out=, e.g. run_one_day
+    :param fleet: number_of_devices in the IT fleet
+    :param number_of_days: Number of days in this chunk
+    :param seed: SeedSequence of this chunk's random stream
+    :param hours_open: number of hours open per day; 10 by default
+    :param antithetic: If True, simulate antithetic pairs of days
+    :return: Structured array of daily_dtype(hours_open), one row per day
+
+    >>> chunk = simulate_chunk(run_one_day_events, 75, 3, np.random.SeedSequence(597))
+    >>> print(chunk.shape, chunk['Inventory qty'].tolist(), pd.DataFrame(chunk).shape)
+    (3,) [75, 75, 75] (3, 28)
+    """
+    sims = np.zeros(number_of_days, daily_dtype(hours_open))
+    sims['Inventory qty'] = fleet
+    for days in range(number_of_days):
+        if antithetic:
+            pair = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (days // 2,))
+            rng = InverseTransformGenerator(pair, days % 2 == 1)
+        else:
+            rng = np.random.default_rng(np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (days,)))
+        # Call the single simulation, writing into its row
+        engine(fleet, hours_open, rng, out=sims[days])
+    return sims
+
+
+def run_simulation(inventory_qtys: list, number_of_days: int = 1, engine=run_one_day, workers: int = 1, seed=None,
+                   chunk_days: int = 25, sink=None, common_random_numbers: bool = False, antithetic: bool = False,
+                   cache=None, progress=None, verbose: bool = True) -> list:
     """
     Run as many days of simulation run_one_day() as specified.
+    Days are split into chunks of chunk_days per inventory qty. Each chunk draws from its own random stream, spawned
+    from one root seed and keyed by (inventory qty, chunk #), and each day from its own child of that stream, so a
+    seeded run gives identical results whatever the number of worker processes.
+    Variance reduction, for comparing inventory qtys with fewer days:
+    - common_random_numbers: day k draws the same patrons, arrivals, wait tolerances and failure rate for every
+      inventory qty (and with run_one_day_events the same reservations), so differences between qtys come from the
+      fleet size and not from the demand.
+    - antithetic: days come in pairs whose random draws mirror each other (u and 1 - u); chunk_days is rounded up to
+      an even number so no pair is split.
+    Either option adds a VARIANCE_REDUCTION table, see variance_reduction().
 
     :param number_of_days: Number of times the simulation should be run for each inventory_qty.
     :param inventory_qtys: Devices qtys to simulate.
+    :param engine: Function that simulates one day, run_one_day (default) or the faster run_one_day_events; for
+                   another arrival profile, e.g. Saturdays, functools.partial(run_one_day_events, arrivals=arrival_profile(weekday=5))
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :param chunk_days: Number of days per chunk of work
+    :param sink: Optional result sink (see saralr2_is597pr_sinks); DETAILED rows are appended to it chunk by chunk
+    :param common_random_numbers: If True, every inventory qty sees the same random draws on the same day
+    :param antithetic: If True, simulate antithetic pairs of days
+    :param cache: Optional ResultCache (see saralr2_is597pr_cache); seeded chunks already on disk are read, not simulated
+    :param progress: Optional function called after every chunk with (days simulated so far, total days to simulate)
+    :param verbose: If False, don't print the start of the run and of each inventory qty
     :return: A list of dataframes with answers to these questions:
     - DETAILED: Full output, useful if you were planning to load the data into Tableau for detailed analysis and visualizations.
     - FINANCIALS: What was the upfront cost of devices and median cost of repairs?
@@ -386,27 +1037,399 @@ def run_simulation(inventory_qtys: list, number_of_days: int = 1) -> list:
     - UTILIZATION: What was the min/median/max utilization rate per hour, grouped by inventory_qty?
 
     From this, the user can discern: How many computers should we buy in the next ITAD (IT asset disposition) cycle?
+
+    >>> serial = run_simulation([75, 95], 5, engine=run_one_day_events, seed=597, chunk_days=2)     # doctest: +ELLIPSIS
+    Running simulation of 5 days...
+    ...
+    >>> parallel = run_simulation([75, 95], 5, engine=run_one_day_events, workers=2, seed=597, chunk_days=2)     # doctest: +ELLIPSIS
+    Running simulation of 5 days...
+    ...
+    >>> serial[0].equals(parallel[0])
+    True
+    >>> crn = run_simulation([75, 155], 2, seed=1, common_random_numbers=True)     # doctest: +ELLIPSIS
+    Running simulation of 2 days...
+    ...
+    >>> crn[0].groupby('Inventory qty')['Patrons today'].apply(list).tolist()     # Every day, not just the first, is shared
+    [[559, 549], [559, 549]]
+    >>> results = run_simulation([75, 95], 60, engine=run_one_day_events, seed=597, common_random_numbers=True, antithetic=True)     # doctest: +ELLIPSIS
+    Running simulation of 60 days...
+    ...
+    >>> reduction = results[-1].set_index(['Method', 'Metric'])['Variance reduction']
+    >>> print(reduction['Common random numbers', 'max wait duration'].max() > .5, reduction['Antithetic', 'Patrons today'].min() > .5)
+    True True
+    """
+    hours_open = 10
+    if verbose:
+        print("Running simulation of", number_of_days, "days...\n")
+    if antithetic:
+        chunk_days += chunk_days % 2
+    sims = []
+    days_done = 0
+    for number_of_devices, start, chunk in simulate_chunks(inventory_qtys, number_of_days, engine, workers, seed, chunk_days, hours_open,
+                                                           common_random_numbers=common_random_numbers, antithetic=antithetic,
+                                                           cache=cache):
+        if start == 0 and verbose:
+            print(datetime.datetime.now(), ": Simulating", number_of_devices, "qty...")
+        sims.append(chunk)
+        if sink is not None:
+            sink.append('detailed_output', pd.DataFrame(chunk).drop(columns=['Repair cost']))
+        days_done += len(chunk)
+        if progress is not None:
+            progress(days_done, len(inventory_qtys) * number_of_days)
+    detailed = pd.DataFrame(np.concatenate(sims))    # detailed is the master DataFrame from which aggregate stats can be derived
+    results = summarize_simulation(detailed, inventory_qtys, hours_open)
+    if common_random_numbers or antithetic:
+        results.append(variance_reduction(detailed, common_random_numbers, antithetic))
+    return results
+
+
+# Daily results variance_reduction() reports on by default
+VARIANCE_METRICS = ['Patrons today', 'Departed wait queue', 'median wait duration', 'max wait duration', 'Repair cost']
+
+
+def variance_reduction(detailed: pd.DataFrame, common_random_numbers: bool = True, antithetic: bool = False,
+                       metrics: list = None) -> pd.DataFrame:
+    """
+    How much variance did common random numbers and antithetic pairs remove? Compares the variance actually achieved
+    with the variance the same days would have had if they were independent:
+    - Common random numbers: for each pair of neighboring inventory qtys, Var(day k of b - day k of a) against
+      Var(a) + Var(b).
+    - Antithetic: for each inventory qty, Var(mean of each pair of days) against Var(day) / 2.
+    Variance reduction = 1 - achieved / independent, so 0.75 means a quarter of the days gives the same precision.
+
+    :param detailed: Daily results from run_simulation(), in day order within each inventory qty, with 'Repair cost'
+    :param common_random_numbers: Report on common random numbers
+    :param antithetic: Report on antithetic pairs of days
+    :param metrics: Daily results columns to report on; VARIANCE_METRICS by default
+    :return: Dataframe with one row per method, comparison and metric
+    """
+    metrics = VARIANCE_METRICS if metrics is None else metrics
+    by_qty = {qty: days[metrics].reset_index(drop=True) for qty, days in detailed.groupby('Inventory qty', sort=True)}
+    qtys = list(by_qty)
+    rows = []
+    if common_random_numbers:
+        for a, b in zip(qtys, qtys[1:]):
+            days = min(len(by_qty[a]), len(by_qty[b]))
+            achieved = (by_qty[b][:days] - by_qty[a][:days]).var()
+            independent = by_qty[a].var() + by_qty[b].var()
+            for metric in metrics:
+                rows.append(['Common random numbers', str(a) + ' vs ' + str(b), metric, achieved[metric], independent[metric]])
+    if antithetic:
+        for qty in qtys:
+            days = by_qty[qty][:len(by_qty[qty]) // 2 * 2]
+            achieved = days.groupby(days.index // 2).mean().var()
+            independent = days.var() / 2
+            for metric in metrics:
+                rows.append(['Antithetic', str(qty), metric, achieved[metric], independent[metric]])
+    report = pd.DataFrame(rows, columns=['Method', 'Comparison', 'Metric', 'Variance', 'Independent variance'])
+    report['Variance reduction'] = 1 - report['Variance'] / report['Independent variance']
+    return report
+
+
+def simulate_chunks(inventory_qtys: list, number_of_days: int, engine=run_one_day, workers: int = 1, seed=None,
+                    chunk_days: int = 25, hours_open: int = 10, start_day: int = 0, common_random_numbers: bool = False,
+                    antithetic: bool = False, cache=None):
+    """
+    Split number_of_days per inventory qty into chunks of chunk_days, run them with simulate_chunk() and yield the
+    results in order. Each chunk draws from its own SeedSequence keyed by (inventory qty, chunk #) under one root seed.
+
+    :param inventory_qtys: Devices qtys to simulate.
+    :param number_of_days: Number of days to simulate for each inventory_qty.
+    :param engine: Function that simulates one day, e.g. run_one_day
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :param chunk_days: Number of days per chunk of work
+    :param hours_open: number of hours open per day; 10 by default
+    :param start_day: # of the first day to simulate, a multiple of chunk_days; lets a run be extended with more days
+    :param common_random_numbers: If True, key the streams by chunk # only, so every inventory qty sees the same draws
+    :param antithetic: If True, simulate antithetic pairs of days; chunk_days must be even so no pair is split
+    :param cache: Optional ResultCache (see saralr2_is597pr_cache); with a seed, only chunks it lacks are simulated
+    :return: Generator of (inventory qty, # of the chunk's first day, chunk array of daily_dtype(hours_open))
+    """
+    if antithetic and chunk_days % 2 == 1:
+        raise ValueError("Antithetic pairs of days need an even chunk_days")
+    # Source: https://numpy.org/doc/stable/reference/random/parallel.html
+    root = np.random.SeedSequence(seed)
+    end_day = start_day + number_of_days
+    chunks = [(number_of_devices, start, min(chunk_days, end_day - start))
+              for number_of_devices in inventory_qtys for start in range(start_day, end_day, chunk_days)]
+    engines = [engine] * len(chunks)
+    fleets = [fleet for fleet, start, days in chunks]
+    lengths = [days for fleet, start, days in chunks]
+    if common_random_numbers:
+        seeds = [np.random.SeedSequence(root.entropy, spawn_key=(start // chunk_days,)) for fleet, start, days in chunks]
+    else:
+        seeds = [np.random.SeedSequence(root.entropy, spawn_key=(fleet, start // chunk_days)) for fleet, start, days in chunks]
+    keys = [None] * len(chunks)
+    cached = [None] * len(chunks)
+    if cache is not None and seed is not None:      # Unseeded runs are never repeated, so there is nothing to reuse
+        keys = [cache.key(engine, fleet, chunk_seed, hours_open, antithetic) for fleet, chunk_seed in zip(fleets, seeds)]
+        cached = [cache.get(key, days) for key, days in zip(keys, lengths)]
+    missing = [i for i, chunk in enumerate(cached) if chunk is None]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 and missing else contextlib.nullcontext() as pool:
+        mapper = pool.map if workers > 1 and missing else map
+        work = mapper(simulate_chunk, [engines[i] for i in missing], [fleets[i] for i in missing],
+                      [lengths[i] for i in missing], [seeds[i] for i in missing], [hours_open] * len(missing),
+                      [antithetic] * len(missing))
+        for (number_of_devices, start, days), key, chunk in zip(chunks, keys, cached):
+            if chunk is None:
+                chunk = next(work)
+                if key is not None:
+                    cache.put(key, chunk)
+            yield number_of_devices, start, chunk
+
+
+def run_many_days(fleets, hours_open: int = 10, rng: np.random.Generator = None, arrivals: ArrivalProfile = None,
+                  computers_available=None, total_patrons=None) -> pd.DataFrame:
+    """
+    Simulate many days at once, one day per entry in fleets, with NumPy arrays instead of a Python loop per day.
+    Same business rules as run_one_day_events(); the state of every day in the batch (computers in use, wait queue by
+    arrival minute, session ends by minute, wait durations) lives in 2-D arrays that advance minute by minute.
+    Today's availability, patron count and arrival minutes are drawn in bulk up front.
+
+    :param fleets: number_of_devices in the IT fleet, one entry per day to simulate
+    :param hours_open: number of hours open per day; 10 by default
+    :param rng: NumPy random Generator; a fresh one is created if None
+    :param arrivals: Optional ArrivalProfile covering hours_open hours; arrival_profile(hours_open) if None
+    :param computers_available: Optional computers in service, one int per day; determine_fleet_availability() if None
+    :param total_patrons: Optional patrons, one int per day; set_total_patrons_count() if None
+    :return: Dataframe with one row per day, the run_one_day() columns plus 'Inventory qty'
+
+    >>> days = run_many_days([75] * 200 + [150] * 200)
+    >>> days.shape
+    (400, 28)
+    >>> by_fleet = days.groupby('Inventory qty').median()
+    >>> print(by_fleet.loc[75, 'Utilization 6'] > .95, by_fleet.loc[150, 'Utilization 6'] < .9)
+    True True
+    >>> print(by_fleet.loc[75, 'Departed wait queue'] > 0, days.loc[days['Inventory qty'] == 150, 'Departed wait queue'].max() == 0)
+    True True
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    fleets = np.asarray(fleets, dtype=np.int64)
+    days = len(fleets)
+    rows = np.arange(days)
+    minutes = hours_open * 60
+
+    # Determine total number of computers and patrons for every day
+    if computers_available is None:
+        computers_available = determine_fleet_availability(fleets, days, rng)
+    computers_available = np.asarray(computers_available, dtype=np.int64)
+    if total_patrons is None:
+        total_patrons_today = set_total_patrons_count(n=days, rng=rng)
+    else:
+        total_patrons_today = np.asarray(total_patrons, dtype=np.int64)
+    arrival_counts = patron_arrival_counts(total_patrons_today, rng, arrivals_for(hours_open, arrivals))
+
+    computers_in_use = np.zeros(days, dtype=np.int64)
+    session_ends = np.zeros((days, minutes + 61), dtype=np.int64)    # Day x minute: # sessions ending that minute
+    wait_queue = np.zeros((days, minutes), dtype=np.int64)          # Day x arrival minute: # patrons still waiting
+    wait_counts = np.zeros((days, minutes + 1), dtype=np.int64)     # Day x wait duration: # patrons
+    waiting = np.zeros(days, dtype=np.int64)
+    departed = np.zeros(days, dtype=np.int64)
+    utilization_by_hour = np.zeros((days, hours_open))
+    wait_count_by_hour = np.zeros((days, hours_open), dtype=np.int64)
+    oldest = 0      # Oldest arrival minute with anybody still waiting, on any day
+
+    for minute in range(minutes):
+        # UPDATE COMPUTER USAGE
+        # Before assigning new patrons to a computer, assign patrons who are waiting, oldest arrival first
+        assigned = np.zeros(days, dtype=np.int64)
+        comps_free = computers_available - computers_in_use
+        serving = np.nonzero((waiting > 0) & (comps_free > 0))[0]
+        if len(serving) > 0:
+            queue = wait_queue[serving, oldest:minute]
+            ahead = np.cumsum(queue, axis=1) - queue
+            served = np.clip(comps_free[serving, None] - ahead, 0, queue)
+            wait_queue[serving, oldest:minute] -= served
+            assigned[serving] = served.sum(axis=1)
+            # Patrons who arrived at minute a waited minute - a; reverse the window so column k is a wait of k + 1
+            wait_counts[serving, 1:minute - oldest + 1] += served[:, ::-1]
+            waiting -= assigned
+        # New patrons get any computers that are still free; the remainder joins the wait queue
+        patrons_this_minute = arrival_counts[:, minute]
+        new_served = np.minimum(patrons_this_minute, computers_available - computers_in_use - assigned)
+        wait_counts[:, 0] += new_served
+        wait_queue[:, minute] = patrons_this_minute - new_served
+        waiting += patrons_this_minute - new_served
+        assigned += new_served
+        # Reservation lengths, as in select_reservation_length(): 30% reserve 15 minutes, the rest 60 minutes.
+        # Only the count of each length matters here, so draw it as one binomial per day.
+        short = rng.binomial(assigned, 0.3)
+        session_ends[:, minute + 15] += short
+        session_ends[:, minute + 60] += assigned - short
+        computers_in_use += assigned
+
+        # UPDATE QUEUE LEAVERS
+        # Free up computer when patron reaches end of reservation length
+        computers_in_use -= session_ends[:, minute]
+        # The cohort that has waited set_wait_length() minutes leaves the queue
+        wait_length = set_wait_length(days, rng)
+        leaving = rows[minute - wait_length >= 0]
+        if len(leaving) > 0:
+            cohort = minute - wait_length[leaving]
+            done_waiting = wait_queue[leaving, cohort]
+            wait_queue[leaving, cohort] = 0
+            waiting[leaving] -= done_waiting
+            departed[leaving] += done_waiting
+            wait_counts[leaving, wait_length[leaving]] += done_waiting
+        while oldest < minute and not wait_queue[:, oldest].any():
+            oldest += 1
+
+        # COLLECT STATS @ END OF EACH HOUR
+        if minute % 60 == 59:
+            utilization_by_hour[:, minute // 60] = computers_in_use / computers_available
+            wait_count_by_hour[:, minute // 60] = waiting
+
+    # UPDATE DAILY RESULTS
+    # Min/median/max wait duration from each day's histogram of wait durations
+    patrons_counted = wait_counts.sum(axis=1)
+    cumulative = np.cumsum(wait_counts, axis=1)
+    lower_middle = np.argmax(cumulative > ((patrons_counted - 1) // 2)[:, None], axis=1)
+    upper_middle = np.argmax(cumulative > (patrons_counted // 2)[:, None], axis=1)
+    nobody = np.where(patrons_counted == 0, np.nan, 0)
+    daily_results = {'Patrons today': total_patrons_today,
+                     'Computers available': computers_available,
+                     'Departed wait queue': departed,
+                     'min wait duration': np.argmax(wait_counts > 0, axis=1) + nobody,
+                     'median wait duration': (lower_middle + upper_middle) / 2 + nobody,
+                     'max wait duration': minutes - np.argmax(wait_counts[:, ::-1] > 0, axis=1) + nobody,
+                     'Repair cost': (fleets - computers_available) * REPAIR_COST}
+    for hour in range(hours_open):
+        daily_results["Utilization " + str(hour + 1)] = utilization_by_hour[:, hour]
+        daily_results["Patrons_waiting " + str(hour + 1)] = wait_count_by_hour[:, hour]
+    daily_results['Inventory qty'] = fleets
+    records = np.zeros(days, daily_dtype(hours_open))
+    for column, values in daily_results.items():
+        records[column] = values
+    return pd.DataFrame(records)
+
+
+class BlockGenerator:
+    """
+    Stand-in for a NumPy random Generator for run_many_days(): the days of a batch are split into blocks, and the
+    draws for each block's days come from that block's own Generator. A block gets the same numbers whatever other
+    blocks share its batch, so results don't depend on how many days are advanced together.
+    Supports the draws run_many_days() makes, which all have one value (or row) per day: uniform, triangular, beta,
+    binomial and multinomial.
+
+    >>> seeds = [np.random.SeedSequence(597, spawn_key=(block,)) for block in range(3)]
+    >>> together = BlockGenerator(seeds, [2, 2, 2]).uniform(0, 1, 6)
+    >>> alone = BlockGenerator(seeds[1:2], [2]).uniform(0, 1, 2)
+    >>> print(np.array_equal(together[2:4], alone))
+    True
+    """
+    def __init__(self, seeds: list, block_days: list):
+        self.generators = [np.random.default_rng(seed) for seed in seeds]
+        self.bounds = np.cumsum([0] + list(block_days))
+
+    def blocks(self, draw) -> np.ndarray:
+        """
+        :param draw: Function of (Generator, slice of the block's days) that draws for those days
+        :return: The blocks' draws, concatenated in day order
+        """
+        return np.concatenate([draw(generator, slice(start, end))
+                               for generator, start, end in zip(self.generators, self.bounds[:-1], self.bounds[1:])])
+
+    @staticmethod
+    def part(values, days: slice):
+        return values[days] if np.ndim(values) else values
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return self.blocks(lambda generator, days: generator.uniform(low, high, days.stop - days.start))
+
+    def triangular(self, left, mode, right, size=None):
+        return self.blocks(lambda generator, days: generator.triangular(left, mode, right, days.stop - days.start))
+
+    def beta(self, a, b, size=None):
+        return self.blocks(lambda generator, days: generator.beta(self.part(a, days), self.part(b, days),
+                                                                  days.stop - days.start))
+
+    def binomial(self, n, p, size=None):
+        return self.blocks(lambda generator, days: generator.binomial(self.part(n, days), self.part(p, days),
+                                                                      days.stop - days.start))
+
+    def multinomial(self, n, pvals):
+        return self.blocks(lambda generator, days: generator.multinomial(np.asarray(n)[days], pvals))
+
+
+def run_simulation_batch(inventory_qtys: list, number_of_days: int = 1, seed=None, batch_size: int = 2000,
+                         chunk_days: int = 250) -> list:
+    """
+    Batched version of run_simulation(): simulate number_of_days for every inventory_qty with run_many_days(),
+    batch_size days at a time, instead of one run_one_day() call per day.
+    Like run_simulation(), days are split into chunks of chunk_days per inventory qty, each drawing from its own
+    random stream keyed by (inventory qty, chunk #) under one root seed. Batches are made of whole chunks, so
+    batch_size only bounds memory use and never changes a seeded run's results.
+
+    :param inventory_qtys: Devices qtys to simulate.
+    :param number_of_days: Number of days to simulate for each inventory_qty.
+    :param seed: Optional root seed (int) for reproducible runs
+    :param batch_size: Max # of days advanced together (at least one chunk); bounds memory use
+    :param chunk_days: Number of days per random stream
+    :return: The same list of dataframes as run_simulation()
+
+    >>> results = run_simulation_batch([75, 95], number_of_days=20, seed=597)   # doctest: +ELLIPSIS
+    Running simulation of 20 days...
+    ...
+    >>> results[0].shape
+    (40, 27)
+    >>> [len(table) for table in results[1:]]
+    [2, 2, 2, 2, 2]
+    >>> results = run_simulation_batch([75, 95], number_of_days=20, seed=597, chunk_days=5)   # doctest: +ELLIPSIS
+    Running simulation of 20 days...
+    ...
+    >>> results[0].equals(run_simulation_batch([75, 95], number_of_days=20, seed=597, batch_size=10, chunk_days=5)[0])   # doctest: +ELLIPSIS
+    Running simulation of 20 days...
+    ...
+    True
     """
     hours_open = 10
     print("Running simulation of", number_of_days, "days...\n")
+    # Source: https://numpy.org/doc/stable/reference/random/parallel.html
+    root = np.random.SeedSequence(seed)
+    chunks = [(fleet, start, min(chunk_days, number_of_days - start))
+              for fleet in inventory_qtys for start in range(0, number_of_days, chunk_days)]
+    batches = [[]]
+    for chunk in chunks:
+        if batches[-1] and sum(days for fleet, start, days in batches[-1]) + chunk[2] > batch_size:
+            batches.append([])
+        batches[-1].append(chunk)
     sims = []
+    simulated = 0
+    for batch in batches:
+        days = sum(days for fleet, start, days in batch)
+        print(datetime.datetime.now(), ": Simulating days", simulated + 1, "to", simulated + days, "of", len(inventory_qtys) * number_of_days, "...")
+        fleets = np.concatenate([np.full(days, fleet) for fleet, start, days in batch])
+        rng = BlockGenerator([np.random.SeedSequence(root.entropy, spawn_key=(fleet, start // chunk_days)) for fleet, start, days in batch],
+                             [days for fleet, start, days in batch])
+        sims.append(run_many_days(fleets, hours_open, rng))
+        simulated += days
+    detailed = pd.concat(sims, ignore_index=True)
+    return summarize_simulation(detailed, inventory_qtys, hours_open)
+
+
+def summarize_simulation(detailed: pd.DataFrame, inventory_qtys: list, hours_open: int = 10) -> list:
+    """
+    Aggregate the detailed daily results of a simulation run into the tables returned by run_simulation().
+
+    :param detailed: One row per simulated day, with the run_one_day() columns plus 'Inventory qty'
+    :param inventory_qtys: Devices qtys that were simulated
+    :param hours_open: number of hours open per day; 10 by default
+    :return: [detailed, financials, wait_durations, departures, patrons_waiting, utilization], see run_simulation()
+
+    >>> days = run_many_days([155] * 20 + [75] * 20, rng=np.random.default_rng(597))
+    >>> financials = summarize_simulation(days, [155, 75])[1]
+    >>> print(financials.index.tolist(), financials.loc[155, 'Median repair cost'] > financials.loc[75, 'Median repair cost'])
+    [155, 75] True
+    """
     # Source: https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.append.html & https://maneeshasane.com/programming/2020/09/pandas-cheat-sheet.html
     financials = pd.concat([pd.DataFrame([i], columns=['Inventory qty']) for i in inventory_qtys], ignore_index=True)
-    # 375 = Your average Chromebook price; Acquisition is a fixed cost based on the number of devices in inventory; Ignore bulk pricing models
-    financials['Acquisition cost'] = financials['Inventory qty'].apply(lambda x: x * 375)
-    for number_of_devices in inventory_qtys:
-        print(datetime.datetime.now(), ": Simulating", number_of_devices, "qty...")
-        # Run the simulation the specified # times
-        for days in range(number_of_days):
-            # Call the single simulation
-            single_simulation = run_one_day(number_of_devices)
-            single_simulation['Inventory qty'] = number_of_devices
-            sims.append(single_simulation)  # List of all simulation dfs
-    detailed = pd.concat(sims, ignore_index=True)    # detailed is the master DataFrame from which aggregate stats can be derived
+    financials['Acquisition cost'] = financials['Inventory qty'].apply(lambda x: x * ACQUISITION_COST)
     repairs = detailed[['Inventory qty', 'Repair cost']]
     # Source: https://stackoverflow.com/questions/46306786/flatten-multi-index-pandas-dataframe-where-column-names-become-values/46306841
     repairs = repairs.groupby('Inventory qty').agg([np.median]).stack().reset_index()
-    financials = pd.concat([financials, repairs['Repair cost']], axis=1)
+    financials = financials.merge(repairs[['Inventory qty', 'Repair cost']], on='Inventory qty', how='left')
     # Source: https://stackoverflow.com/questions/43290051/renaming-tuple-column-name-in-dataframe
     financials = financials.rename(columns={financials.columns[-1]: "Median repair cost"})
     financials['Total cost'] = financials['Acquisition cost'] + financials['Median repair cost']
@@ -427,23 +1450,479 @@ def run_simulation(inventory_qtys: list, number_of_days: int = 1) -> list:
     return [detailed, financials, wait_durations, departures, patrons_waiting, utilization]
 
 
-def main():
+class StreamingHistogram:
+    """
+    Constant-memory quantile sketch: a sorted histogram of at most max_bins (value, count) centroids.
+    Exact while the stream has no more than max_bins distinct values; after that, each new value merges the two
+    closest centroids into their weighted mean.
+    Source: Ben-Haim, Yael and Elad Tom-Tov. "A Streaming Parallel Decision Tree Algorithm," JMLR 11 (2010).
+
+    >>> sketch = StreamingHistogram()
+    >>> for x in [3, 1, 4, 1, 5, 9, 2, 6]:
+    ...     sketch.add(x)
+    >>> sketch.median()
+    3.5
+    >>> sketch = StreamingHistogram(max_bins=50)
+    >>> for x in np.random.default_rng(597).normal(100, 15, 10000):
+    ...     sketch.add(x)
+    >>> print(len(sketch.values), abs(sketch.median() - 100) < 1)
+    50 True
+    """
+    def __init__(self, max_bins: int = 256):
+        self.max_bins = max_bins
+        self.values = []
+        self.counts = []
+
+    def add(self, x: float):
+        """
+        Add one value to the sketch.
+
+        :param x: Value to add
+        :return: None
+        """
+        i = bisect.bisect_left(self.values, x)
+        if i < len(self.values) and self.values[i] == x:
+            self.counts[i] += 1
+            return
+        self.values.insert(i, x)
+        self.counts.insert(i, 1)
+        if len(self.values) > self.max_bins:
+            j = int(np.argmin(np.diff(self.values)))
+            merged = self.counts[j] + self.counts[j + 1]
+            self.values[j] = (self.values[j] * self.counts[j] + self.values[j + 1] * self.counts[j + 1]) / merged
+            self.counts[j] = merged
+            del self.values[j + 1]
+            del self.counts[j + 1]
+
+    def median(self) -> float:
+        """
+        :return: Median of the values added so far (mean of the two middle values for an even count), NaN if empty
+        """
+        total = sum(self.counts)
+        if total == 0:
+            return np.nan
+        ranks = [(total - 1) // 2, total // 2]
+        middle = []
+        seen = 0
+        for value, count in zip(self.values, self.counts):
+            seen += count
+            while ranks and ranks[0] < seen:
+                middle.append(value)
+                ranks.pop(0)
+            if not ranks:
+                break
+        return (middle[0] + middle[1]) / 2
+
+
+class RunningStats:
+    """
+    Running count, min, max and approximate median of one column of daily results. NaN is skipped, as in pandas.
+
+    >>> stats = RunningStats()
+    >>> for x in [2, np.nan, 7, 1]:
+    ...     stats.add(x)
+    >>> print(stats.count, stats.stat('min'), stats.stat('median'), stats.stat('max'))
+    3 1 2.0 7
+    """
+    def __init__(self):
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.sketch = StreamingHistogram()
+
+    def add(self, x: float):
+        """
+        Add one day's value.
+
+        :param x: Value to add
+        :return: None
+        """
+        if x != x:      # NaN
+            return
+        if self.count == 0 or x < self.min:
+            self.min = x
+        if self.count == 0 or x > self.max:
+            self.max = x
+        self.count += 1
+        self.sketch.add(x)
+
+    def stat(self, name: str) -> float:
+        """
+        :param name: 'min', 'median' or 'max'
+        :return: That statistic of the values added so far
+        """
+        if name == 'median':
+            return self.sketch.median()
+        return getattr(self, name)
+
+
+def summarize_running_stats(stats: dict, hours_open: int = 10) -> list:
+    """
+    Build the run_simulation() aggregate tables from RunningStats instead of the detailed dataframe.
+
+    :param stats: Inventory qty -> {column name: RunningStats}
+    :param hours_open: number of hours open per day; 10 by default
+    :return: [financials, wait_durations, departures, patrons_waiting, utilization], see run_simulation()
     """
-    Requests user input for # days to simulate. Outputs results to CSV files.
-    :return: None
+    inventory_qtys = sorted(stats)
+    index = pd.Index(inventory_qtys, name='Inventory qty')
+
+    def table(columns, functions):
+        return pd.DataFrame({(column, function): [stats[qty][column].stat(function) for qty in inventory_qtys]
+                             for column in columns for function in functions}, index=index)
+
+    financials = pd.DataFrame({'Acquisition cost': [qty * ACQUISITION_COST for qty in inventory_qtys],
+                               'Median repair cost': [stats[qty]['Repair cost'].stat('median') for qty in inventory_qtys]},
+                              index=index)
+    financials['Total cost'] = financials['Acquisition cost'] + financials['Median repair cost']
+    wait_durations = table(['min wait duration', 'median wait duration', 'max wait duration'], ['median'])
+    departures = table(['Patrons today', 'Departed wait queue'], ['min', 'median', 'max'])
+    patrons_waiting = table(['Patrons_waiting ' + str(hour + 1) for hour in range(hours_open)], ['max'])
+    utilization = table(['Utilization ' + str(hour + 1) for hour in range(hours_open)], ['min', 'median', 'max'])
+    return [financials, wait_durations, departures, patrons_waiting, utilization]
+
+
+def run_simulation_streaming(inventory_qtys: list, number_of_days: int = 1, engine=run_one_day, workers: int = 1,
+                             seed=None, chunk_days: int = 25, sink=None) -> list:
+    """
+    Streaming version of run_simulation(): each chunk of days is folded into per-inventory-qty RunningStats as soon as
+    it finishes, so memory stays constant however many days are simulated and DETAILED is never built in memory.
+    Min, max and counts are exact; medians come from StreamingHistogram sketches.
+
+    :param inventory_qtys: Devices qtys to simulate.
+    :param number_of_days: Number of times the simulation should be run for each inventory_qty.
+    :param engine: Function that simulates one day, run_one_day (default) or the faster run_one_day_events
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :param chunk_days: Number of days per chunk of work
+    :param sink: Optional result sink (see saralr2_is597pr_sinks); DETAILED rows are appended to it as they are produced
+    :return: The run_simulation() list of dataframes, with None in place of DETAILED
+
+    >>> streamed = run_simulation_streaming([75, 95], 20, engine=run_one_day_events, seed=597)     # doctest: +ELLIPSIS
+    Running simulation of 20 days...
+    ...
+    >>> in_memory = run_simulation([75, 95], 20, engine=run_one_day_events, seed=597)     # doctest: +ELLIPSIS
+    Running simulation of 20 days...
+    ...
+    >>> streamed[0] is None
+    True
+    >>> all(np.allclose(a.values, b.values) and list(a.columns) == list(b.columns) for a, b in zip(streamed[1:], in_memory[1:]))
+    True
+    """
+    hours_open = 10
+    print("Running simulation of", number_of_days, "days...\n")
+    stats = {qty: {} for qty in inventory_qtys}
+    for number_of_devices, start, chunk in simulate_chunks(inventory_qtys, number_of_days, engine, workers, seed, chunk_days, hours_open):
+        if start == 0:
+            print(datetime.datetime.now(), ": Simulating", number_of_devices, "qty...")
+        for column in chunk.dtype.names[:-1]:      # All but 'Inventory qty'
+            running = stats[number_of_devices].setdefault(column, RunningStats())
+            for x in chunk[column].tolist():
+                running.add(x)
+        if sink is not None:
+            sink.append('detailed_output', pd.DataFrame(chunk).drop(columns=['Repair cost']))
+    return [None] + summarize_running_stats(stats, hours_open)
+
+
+# Default confidence interval widths at which run_simulation_adaptive() stops simulating an inventory qty:
+# minutes of median wait, patrons departing the queue per day, and utilization rate (applied to every hour)
+PRECISION_TOLERANCE = {'median wait duration': 1.0, 'Departed wait queue': 2.0, 'Utilization': 0.02}
+
+
+def median_interval(values, confidence: float = 0.95) -> tuple:
+    """
+    Distribution-free confidence interval for the median, from order statistics: the number of values below the
+    median is Binomial(n, 0.5), approximated here by a normal distribution.
+    Source: Conover, W. J. Practical Nonparametric Statistics. Third edition. Wiley, 1999.
+
+    :param values: Array of values, or 2-D array with one column per variable
+    :param confidence: Confidence level of the interval
+    :return: (low, high) bounds, one per column for 2-D input
+
+    >>> low, high = median_interval(np.arange(1, 101))
+    >>> print(float(low), float(high))
+    40.0 61.0
+    >>> low, high = median_interval([5, 1, 3])      # Too few values to narrow it down: the interval is the whole range
+    >>> print(float(low), float(high))
+    1.0 5.0
+    """
+    values = np.sort(np.asarray(values, dtype=float), axis=0)
+    n = len(values)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    low = max(int(np.floor(n / 2 - z * np.sqrt(n) / 2)), 1)
+    high = min(int(np.ceil(1 + n / 2 + z * np.sqrt(n) / 2)), n)
+    return values[low - 1], values[high - 1]
+
+
+def precision_widths(detailed: pd.DataFrame, confidence: float = 0.95, hours_open: int = 10) -> dict:
+    """
+    Width of the confidence interval for the median of each PRECISION_TOLERANCE metric, over the days in detailed.
+
+    :param detailed: Daily results for one inventory qty
+    :param confidence: Confidence level of the intervals
+    :param hours_open: number of hours open per day; 10 by default
+    :return: Metric -> interval width; 'Utilization' is the widest of the hourly utilization intervals
+    """
+    widths = {}
+    for metric in ['median wait duration', 'Departed wait queue']:
+        low, high = median_interval(detailed[metric], confidence)
+        widths[metric] = high - low
+    low, high = median_interval(detailed[['Utilization ' + str(hour + 1) for hour in range(hours_open)]], confidence)
+    widths['Utilization'] = (high - low).max()
+    return widths
+
+
+def run_simulation_adaptive(inventory_qtys: list, tolerance: dict = None, max_days: int = 7300, batch_days: int = 25,
+                            confidence: float = 0.95, engine=run_one_day_events, workers: int = 1, seed=None) -> list:
+    """
+    Precision-targeted version of run_simulation(): instead of a fixed number of days, simulate batch_days at a time
+    and stop each inventory qty once the confidence intervals for its median wait, departures and hourly utilization
+    are all narrower than the tolerance. Days not needed by settled inventory qtys go to the ones that are still noisy,
+    until max_days have been simulated in total.
+
+    :param inventory_qtys: Devices qtys to simulate.
+    :param tolerance: Optional confidence interval widths to stop at, overriding PRECISION_TOLERANCE
+    :param max_days: Budget of days to simulate, across all inventory qtys
+    :param batch_days: Number of days simulated per inventory qty between precision checks
+    :param confidence: Confidence level of the intervals
+    :param engine: Function that simulates one day, run_one_day_events (default) or run_one_day
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :return: The run_simulation() list of dataframes, plus PRECISION: days simulated, achieved interval widths and
+    whether the tolerance was met, by inventory qty
+
+    >>> results = run_simulation_adaptive([75, 155], max_days=1000, batch_days=50, seed=597)     # doctest: +ELLIPSIS
+    Running simulation until ...
+    >>> precision = results[-1]
+    >>> list(precision.columns)
+    ['Days simulated', 'median wait duration CI width', 'Departed wait queue CI width', 'Utilization CI width', 'Converged']
+    >>> print(precision['Days simulated'].sum() <= 1000, precision.loc[155, 'Converged'],
+    ...       precision.loc[155, 'Days simulated'] <= precision.loc[75, 'Days simulated'])
+    True True True
+    """
+    hours_open = 10
+    tolerance = dict(PRECISION_TOLERANCE, **(tolerance or {}))
+    print("Running simulation until confidence intervals are within", tolerance, "or", max_days, "days...\n")
+    sims = {qty: [] for qty in inventory_qtys}
+    widths = {}
+    active = list(inventory_qtys)
+    budget = max_days
+    batch = 0
+    while active and budget >= len(active):
+        days = min(batch_days, budget // len(active))
+        for number_of_devices, start, chunk in simulate_chunks(active, days, engine, workers, seed, batch_days, hours_open,
+                                                                start_day=batch * batch_days):
+            sims[number_of_devices].append(chunk)
+        budget -= days * len(active)
+        batch += 1
+        for number_of_devices in list(active):
+            widths[number_of_devices] = precision_widths(pd.DataFrame(np.concatenate(sims[number_of_devices])), confidence, hours_open)
+            if all(widths[number_of_devices][metric] <= tolerance[metric] for metric in tolerance):
+                print(datetime.datetime.now(), ":", number_of_devices, "qty settled after",
+                      sum(len(chunk) for chunk in sims[number_of_devices]), "days")
+                active.remove(number_of_devices)
+    detailed = pd.DataFrame(np.concatenate([chunk for qty in inventory_qtys for chunk in sims[qty]]))
+    precision = pd.DataFrame({'Days simulated': [sum(len(chunk) for chunk in sims[qty]) for qty in inventory_qtys]},
+                             index=pd.Index(inventory_qtys, name='Inventory qty'))
+    for metric in tolerance:
+        precision[metric + ' CI width'] = [widths[qty][metric] for qty in inventory_qtys]
+    precision['Converged'] = [qty not in active for qty in inventory_qtys]
+    return summarize_simulation(detailed, inventory_qtys, hours_open) + [precision]
+
+
+def optimize_fleet_size(limit: float, metric: str = 'Departed wait queue', quantile: float = 0.5, low: int = 50,
+                        high: int = 200, number_of_days: int = 200, engine=run_one_day_events, workers: int = 1,
+                        seed=None) -> list:
+    """
+    How many computers should we buy? Find the cheapest inventory qty whose service level meets a target, by
+    bisection over the integer fleet sizes between low and high instead of a dense grid of run_simulation() calls.
+    Service level = the quantile of a daily metric across simulated days, e.g. median 'Departed wait queue' (default)
+    or 90th percentile 'max wait duration' (quantile=.9); it must be <= limit. Cost = ACQUISITION_COST per device
+    + the median daily repair cost (REPAIR_COST per device out of service).
+    Every candidate is simulated with the same random streams (common random numbers), so two fleet sizes face the
+    same patrons, arrivals and failures and their difference isn't buried in day-to-day noise.
+
+    :param limit: Highest acceptable service level
+    :param metric: Daily results column to measure the service level with
+    :param quantile: Quantile of the metric across days, 0.5 = median
+    :param low: Smallest inventory qty to consider
+    :param high: Largest inventory qty to consider
+    :param number_of_days: Number of days simulated per candidate
+    :param engine: Function that simulates one day, run_one_day_events (default) or run_one_day
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :return: [cheapest inventory qty meeting the target (None if even high doesn't), dataframe of evaluated candidates]
+
+    >>> best, candidates = optimize_fleet_size(5, low=60, high=160, number_of_days=100, seed=597)     # doctest: +ELLIPSIS
+    Searching ...
+    >>> print(70 < best < 110, len(candidates) < 10, candidates.loc[best, 'Meets target'])
+    True True True
+    >>> print(candidates.loc[best - 1, 'Meets target'])     # Bisection always ends next to a fleet that falls short
+    False
+
+    Unseeded searches draw one root seed up front, so the candidates still face the same patrons.
+    >>> best, candidates = optimize_fleet_size(5, low=60, high=160, number_of_days=50)     # doctest: +ELLIPSIS
+    Searching ...
+    >>> candidates['Patrons simulated'].nunique()
+    1
+    """
+    hours_open = 10
+    # One root seed for every candidate; seed=None would otherwise give each simulate_chunks() call fresh entropy
+    seed = np.random.SeedSequence(seed).entropy
+    print("Searching", low, "to", high, "computers for", metric, "quantile", quantile, "<=", limit, "...\n")
+    evaluated = {}
+
+    def evaluate(fleet):
+        if fleet not in evaluated:
+            chunks = [chunk for qty, start, chunk in simulate_chunks([fleet], number_of_days, engine, workers, seed,
+                                                                     hours_open=hours_open, common_random_numbers=True)]
+            detailed = pd.DataFrame(np.concatenate(chunks))
+            service_level = detailed[metric].quantile(quantile)
+            evaluated[fleet] = {'Service level': service_level,
+                                'Meets target': service_level <= limit,
+                                'Total cost': fleet * ACQUISITION_COST + detailed['Repair cost'].median(),
+                                'Patrons simulated': int(detailed['Patrons today'].sum())}
+            print(datetime.datetime.now(), ":", fleet, "qty:", metric, "=", service_level)
+        return evaluated[fleet]['Meets target']
+
+    # Service improves as the fleet grows, so bisect for the smallest fleet that meets the target
+    if evaluate(high):
+        if evaluate(low):
+            high = low
+        while high - low > 1:
+            middle = (low + high) // 2
+            if evaluate(middle):
+                high = middle
+            else:
+                low = middle
+    candidates = pd.DataFrame.from_dict(evaluated, orient='index').sort_index()
+    candidates.index.name = 'Inventory qty'
+    feasible = candidates[candidates['Meets target']]
+    best = int(feasible['Total cost'].idxmin()) if len(feasible) > 0 else None
+    print("\nCheapest fleet meeting the target:", best, "(", len(candidates) * number_of_days, "days simulated )")
+    return [best, candidates]
+
+
+# Engines the command line can choose from
+ENGINES = {'run_one_day': run_one_day, 'run_one_day_events': run_one_day_events}
+# Default fleets to compare: [75, 150, 225, 300, 375] in the first runs
+DEFAULT_FLEETS = [75, 95, 115, 135, 155]
+RESULT_NAMES = ['financial_overview', 'wait_durations_in_minutes',
+                'patron_departures', 'max_patrons_waiting_by_hour', 'utilization_by_hour']
+
+
+class ProgressReport:
+    """
+    Progress function for run_simulation(): print days simulated and days per second, at most once every interval
+    seconds and always when the run is done.
+
+    >>> import io
+    >>> log = io.StringIO()
+    >>> report = ProgressReport(interval=3600, file=log)
+    >>> for days_done in [25, 50, 75, 100]:
+    ...     report(days_done, 100)
+    >>> print(len(log.getvalue().splitlines()), log.getvalue().split(',')[0])
+    1 100/100 days (100%)
+    """
+    def __init__(self, interval: float = 1.0, file=None):
+        self.interval = interval
+        self.file = file
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    def __call__(self, days_done: int, total_days: int):
+        now = time.perf_counter()
+        if now - self.reported < self.interval and days_done < total_days:
+            return
+        self.reported = now
+        print(str(days_done) + '/' + str(total_days), 'days (' + str(100 * days_done // total_days) + '%),',
+              round(days_done / max(now - self.started, 1e-9)), 'days/s', file=self.file, flush=True)
+
+
+def parse_arguments(argv: list = None) -> argparse.Namespace:
+    """
+    Read the command line. Options can also come from a JSON config file whose keys are the option names, e.g.
+    {"fleets": [75, 95], "days": 1460, "seed": 597, "format": "npz"}; options given on the command line win.
+
+    :param argv: Command line arguments, sys.argv[1:] if None
+    :return: Parsed options
+
+    >>> args = parse_arguments(['--fleets', '95', '75', '95', '--days', '30', '--seed', '597'])
+    >>> print(args.fleets, args.days, args.seed, args.format, args.engine)
+    [75, 95] 30 597 csv run_one_day_events
+    >>> parse_arguments(['--config', 'missing.json'])
+    Traceback (most recent call last):
+    ...
+    FileNotFoundError: [Errno 2] No such file or directory: 'missing.json'
+    """
+    parser = argparse.ArgumentParser(description='Simulate library computer utilization for several fleet sizes.')
+    parser.add_argument('--config', help='JSON file of options; command line options override it')
+    parser.add_argument('--fleets', type=int, nargs='+', default=DEFAULT_FLEETS, help='Inventory qtys to simulate')
+    parser.add_argument('--days', type=int, default=365, help='Days to simulate per inventory qty (4 years = 1460)')
+    parser.add_argument('--seed', type=int, help='Root seed for reproducible runs')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--engine', choices=list(ENGINES), default='run_one_day_events')
+    parser.add_argument('--chunk-days', type=int, default=25, help='Days per chunk of work')
+    parser.add_argument('--common-random-numbers', action='store_true', help='Same random draws for every fleet')
+    parser.add_argument('--antithetic', action='store_true', help='Simulate antithetic pairs of days')
+    parser.add_argument('--cache', help='Folder of a result cache, so seeded chunks are only simulated once')
+    parser.add_argument('--format', choices=list(SINKS), default='csv', help='Output format')
+    parser.add_argument('--output', default='sample_output/', help='Folder to write the tables to')
+    parser.add_argument('--quiet', action='store_true', help='Only print the final summary, no status or progress lines')
+    args = parser.parse_args(argv)
+    if args.config is not None:
+        with open(args.config) as file:
+            config = json.load(file)
+        unknown = [key for key in config if key.replace('-', '_') not in vars(args)]
+        if unknown:
+            parser.error('unknown option(s) in ' + args.config + ': ' + ', '.join(unknown))
+        parser.set_defaults(**{key.replace('-', '_'): value for key, value in config.items()})
+        args = parser.parse_args(argv)
+    # A fleet listed twice would get the same random streams and repeat the same days
+    args.fleets = sorted(set(args.fleets))
+    return args
+
+
+def main(argv: list = None) -> int:
+    """
+    Run the simulation from the command line and write the results to CSV (default), NPZ or Parquet files, e.g.
+    python saralr2_is597pr_final.py --days 1460 --seed 597 --format npz --workers 4
+    Started without arguments from a terminal, it asks for the # days to simulate and the output format instead.
+
+    :param argv: Command line arguments, sys.argv[1:] if None
+    :return: Exit status
     """
-    try:
-        days = int(input("How many days should the simulation run? "))      # 1 year=365; 4 years=1,460
-        results = run_simulation([75, 95, 115, 135, 155], number_of_days=days)            # [75, 150, 225, 300, 375]
-        folder = 'sample_output/'
-        filenames = ['detailed_output.csv', 'financial_overview.csv', 'wait_durations_in_minutes.csv',
-                     'patron_departures.csv', 'max_patrons_waiting_by_hour.csv', 'utilization_by_hour.csv']
-        # Source: https://realpython.com/python-zip-function/#traversing-lists-in-parallel
-        for df, output in zip(results, filenames):
-            df.to_csv(folder + output)
-    except ValueError:
-        print("Please enter an integer. ")
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv and sys.stdin.isatty():
+        try:
+            days = int(input("How many days should the simulation run? "))      # 1 year=365; 4 years=1,460
+        except ValueError:
+            print("Please enter an integer. ")
+            return 1
+        output_format = input("Output format, csv, npz or parquet? [csv] ").strip().lower() or 'csv'
+        argv = ['--days', str(days), '--format', output_format]
+    args = parse_arguments(argv)
+    cache = None
+    if args.cache is not None:
+        from saralr2_is597pr_cache import ResultCache
+        cache = ResultCache(args.cache)
+    sink = open_sink(args.format, args.output)
+    started = time.perf_counter()
+    results = run_simulation(args.fleets, number_of_days=args.days, engine=ENGINES[args.engine], workers=args.workers,
+                             seed=args.seed, chunk_days=args.chunk_days, sink=sink,
+                             common_random_numbers=args.common_random_numbers, antithetic=args.antithetic, cache=cache,
+                             progress=None if args.quiet else ProgressReport(), verbose=not args.quiet)
+    elapsed = time.perf_counter() - started
+    # Source: https://realpython.com/python-zip-function/#traversing-lists-in-parallel
+    for df, output in zip(results[1:], RESULT_NAMES + ['variance_reduction']):
+        sink.write(output, df)
+    sink.close()
+    total_days = len(args.fleets) * args.days
+    print("Simulated", total_days, "days in", round(elapsed, 1), "s (", round(total_days / elapsed), "days/s ); results in",
+          args.output)
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Multi-branch simulation of a library network
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+The single-branch model, run for every branch of a library system at once. Each branch has its own fleet, open
+hours and demand scale (patrons per day relative to Harold Washington Library Center, where the model was
+calibrated). Optionally, a shared pool of spare computers replaces devices that fail each day. Branches are
+simulated in chunks of days across worker processes; the spare pool is allocated up front, since it couples the
+branches day by day.
+
+Branch data comes from the Chicago Data Portal: Connect Chicago locations (bmus-hp7e) for computers and hours, and
+the yearly computer sessions by location (e.g. fhfm-vdz3 for 2019) for demand. The copies in data/ are filtered to
+Harold Washington; for the whole network, download the unfiltered datasets, e.g.
+https://data.cityofchicago.org/resource/bmus-hp7e.json?organization_type=Chicago%20Public%20Library
+https://data.cityofchicago.org/resource/fhfm-vdz3.json
+"""
+import concurrent.futures
+import contextlib
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import saralr2_is597pr_final as sim
+from saralr2_is597pr_data import DATA_DIR
+
+WEEKDAYS = {'M': 0, 'TU': 1, 'W': 2, 'TH': 3, 'F': 4, 'SA': 5, 'SU': 6}
+# Harold Washington Library Center's computer sessions in 2019 (fhfm-vdz3): demand_scale = 1
+REFERENCE_SESSIONS = 209583
+
+
+def parse_hours(hours: str) -> dict:
+    """
+    Parse Connect Chicago opening hours.
+
+    :param hours: e.g. 'M-TH: 9AM-9PM; F, SA: 9AM-5PM; SU: 1PM-5PM'
+    :return: {weekday (Monday = 0): (opening hour, hours open)} for the days the branch is open
+
+    >>> parse_hours('M-TH: 9AM-9PM; F, SA: 9AM-5PM; SU: 1PM-5PM')
+    {0: (9, 12), 1: (9, 12), 2: (9, 12), 3: (9, 12), 4: (9, 8), 5: (9, 8), 6: (13, 4)}
+    """
+    def hour(time):
+        number, meridiem = re.fullmatch(r'(\d{1,2})(?::\d\d)?\s*([AP]M)', time.strip().upper()).groups()
+        return int(number) % 12 + (12 if meridiem == 'PM' else 0)
+
+    schedule = {}
+    for segment in hours.split(';'):
+        if ':' not in segment:
+            continue
+        days, times = segment.split(':', 1)
+        if '-' not in times:
+            continue    # e.g. 'Closed'
+        opening, closing = (hour(time) for time in times.split('-'))
+        for days_range in days.split(','):
+            first, _, last = days_range.strip().upper().partition('-')
+            for weekday in range(WEEKDAYS[first], WEEKDAYS[last or first] + 1):
+                schedule[weekday] = (opening, closing - opening)
+    return schedule
+
+
+class Branch:
+    """
+    One library branch: its computers, open hours and demand relative to Harold Washington Library Center.
+
+    >>> branch = Branch('Harold Washington', fleet=153, hours_open=12)
+    >>> print(branch.name, branch.fleet, branch.demand_scale, branch.hours_open)
+    Harold Washington 153 1.0 12
+    """
+    def __init__(self, name: str, fleet: int, demand_scale: float = 1.0, hours_open: int = 10):
+        self.name = name
+        self.fleet = fleet
+        self.demand_scale = demand_scale
+        self.hours_open = hours_open
+
+    def __repr__(self):
+        return 'Branch(' + repr(self.name) + ', ' + str(self.fleet) + ', ' + str(self.demand_scale) + ', ' + str(self.hours_open) + ')'
+
+    @classmethod
+    def from_connect_chicago(cls, location: dict, annual_sessions: int = None):
+        """
+        :param location: One Connect Chicago record, with 'hardware_public' and 'hours'
+        :param annual_sessions: The branch's computer sessions in a year; demand_scale = 1 if None
+        :return: Branch open the hours of its most common weekday schedule
+        """
+        schedule = list(parse_hours(location.get('hours', '')).values())
+        hours_open = max(set(schedule), key=schedule.count)[1] if schedule else 10
+        demand_scale = 1.0 if annual_sessions is None else annual_sessions / REFERENCE_SESSIONS
+        return cls(location['organization_name'], int(location['hardware_public']), demand_scale, hours_open)
+
+
+def branch_key(name: str) -> str:
+    """
+    Normalize branch names across datasets.
+
+    >>> branch_key('Harold Washington Library-HWLC') == branch_key('HAROLD WASHINGTON LIBRARY CENTER')
+    True
+    """
+    name = re.sub(r'[^a-z ]', ' ', name.lower())
+    name = re.sub(r'\b(library|center|branch|hwlc|regional)\b', ' ', name)
+    return ' '.join(name.split())
+
+
+def load_branches(locations_path: str = os.path.join(DATA_DIR, 'bmus-hp7e.json'),
+                  sessions_path: str = os.path.join(DATA_DIR, 'fhfm-vdz3.json')) -> list:
+    """
+    Build the branch list from Connect Chicago locations and one year of computer sessions by location. Locations
+    without public computers (no count, or a count of 0) are skipped.
+
+    :param locations_path: Connect Chicago locations JSON (bmus-hp7e)
+    :param sessions_path: Computer sessions by location JSON for one year
+    :return: List of Branch
+
+    >>> load_branches()
+    [Branch('Harold Washington Library-HWLC', 153, 1.0, 12)]
+    >>> import tempfile
+    >>> locations = os.path.join(tempfile.mkdtemp(), 'locations.json')
+    >>> with open(locations, 'w') as file:
+    ...     json.dump([{'organization_name': 'Closed Branch', 'hardware_public': '0'}], file)
+    >>> load_branches(locations)
+    []
+    """
+    with open(locations_path) as file:
+        locations = json.load(file)
+    with open(sessions_path) as file:
+        sessions = {branch_key(row['location']): int(row['ytd']) for row in json.load(file)}
+    return [Branch.from_connect_chicago(location, sessions.get(branch_key(location['organization_name'])))
+            for location in locations
+            if int(location.get('hardware_public') or 0) > 0
+            and location.get('organization_type', 'Chicago Public Library') == 'Chicago Public Library']
+
+
+def allocate_spares(failures: np.ndarray, spares: int) -> np.ndarray:
+    """
+    Each day, send the shared spare computers to the branches with the most failed computers first.
+
+    :param failures: Failed computers, shaped (branches, days)
+    :param spares: Spare computers in the shared pool
+    :return: Spares sent to each branch each day, shaped like failures
+
+    >>> allocate_spares(np.array([[3, 0], [5, 1], [1, 4]]), 6)
+    array([[1, 0],
+           [5, 1],
+           [0, 4]])
+    """
+    order = np.argsort(-failures, axis=0, kind='stable')
+    ranked = np.take_along_axis(failures, order, axis=0)
+    before = np.cumsum(ranked, axis=0) - ranked     # Failures at branches ahead in line
+    sent = np.clip(spares - before, 0, ranked)
+    replaced = np.empty_like(sent)
+    np.put_along_axis(replaced, order, sent, axis=0)
+    return replaced
+
+
+def simulate_branch(branch: Branch, computers_available: np.ndarray, seed: np.random.SeedSequence,
+                    engine=sim.run_many_days) -> pd.DataFrame:
+    """
+    Simulate consecutive days at one branch. This is the unit of work run_network() hands to worker processes.
+
+    :param branch: Branch
+    :param computers_available: Computers in service each day, after spares
+    :param seed: SeedSequence of this chunk's random stream
+    :param engine: run_many_days (default, vectorized) or a one-day engine such as run_one_day_events
+    :return: Dataframe with one row per day: patrons, departures, wait durations, daily mean utilization and the
+             peak # of patrons waiting
+    """
+    rng = np.random.default_rng(seed)
+    days = len(computers_available)
+    patrons = (sim.set_total_patrons_count(n=days, rng=rng) * branch.demand_scale).astype(np.int64)
+    if engine is sim.run_many_days:
+        daily = engine([branch.fleet] * days, branch.hours_open, rng, computers_available=computers_available,
+                       total_patrons=patrons)
+    else:
+        records = np.zeros(days, sim.daily_dtype(branch.hours_open))
+        for day in range(days):
+            engine(branch.fleet, branch.hours_open, rng, total_patrons=int(patrons[day]),
+                   computers_available=int(computers_available[day]), out=records[day])
+        daily = pd.DataFrame(records)
+    hours = [str(hour) for hour in range(1, branch.hours_open + 1)]
+    return pd.DataFrame({'Patrons today': daily['Patrons today'],
+                         'Departed wait queue': daily['Departed wait queue'],
+                         'median wait duration': daily['median wait duration'],
+                         'max wait duration': daily['max wait duration'],
+                         'Utilization': daily[['Utilization ' + hour for hour in hours]].mean(axis=1),
+                         'Peak patrons waiting': daily[['Patrons_waiting ' + hour for hour in hours]].max(axis=1)})
+
+
+def run_network(branches: list, number_of_days: int = 365, spares: int = 0, workers: int = 1, seed=None,
+                chunk_days: int = 365, engine=sim.run_many_days) -> list:
+    """
+    Simulate every branch of a library network for number_of_days.
+    Failures are drawn for every branch and day up front with determine_fleet_availability(); spares from the shared
+    pool replace them (allocate_spares()), and the branches are then simulated independently, in chunks of chunk_days,
+    on worker processes. Repairs are charged for every failed computer, replaced or not.
+
+    :param branches: List of Branch, e.g. load_branches()
+    :param number_of_days: Number of days to simulate
+    :param spares: Spare computers in the shared pool
+    :param workers: Number of worker processes; 1 runs everything in this process
+    :param seed: Optional root seed (int) for reproducible runs
+    :param chunk_days: Number of days per chunk of work
+    :param engine: run_many_days (default, vectorized) or a one-day engine such as run_one_day_events
+    :return: A list of dataframes:
+    - DETAILED: One row per branch and day
+    - BRANCHES: Per branch: fleet, hours, demand, median/max daily results, utilization and costs
+    - SYSTEM: Network-wide daily totals (min/median/max over days) and costs, including the spare pool
+
+    >>> branches = [Branch('Central', 150, 1.0, 12), Branch('North', 20, .15, 8), Branch('South', 30, .2, 8)]
+    >>> detailed, by_branch, system = run_network(branches, 60, spares=6, seed=597, chunk_days=25)
+    >>> print(detailed.shape, by_branch.index.tolist())
+    (180, 12) ['Central', 'North', 'South']
+    >>> print(by_branch.loc['Central', 'Patrons per day (median)'] > 5 * by_branch.loc['North', 'Patrons per day (median)'])
+    True
+    >>> print(system.loc['Computers', 'median'], system.loc['Acquisition cost', 'median'])
+    206.0 77250.0
+    >>> run_network(branches, 60, spares=6, seed=597, workers=2, chunk_days=25)[0].equals(detailed)
+    True
+    """
+    root = np.random.SeedSequence(seed)
+    fleets = np.array([branch.fleet for branch in branches], dtype=np.int64)
+    failure_rng = np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=(0,)))
+    available = sim.determine_fleet_availability(np.repeat(fleets, number_of_days), len(fleets) * number_of_days,
+                                                 failure_rng).reshape(len(fleets), number_of_days)
+    failures = fleets[:, None] - available
+    replaced = allocate_spares(failures, spares)
+    in_service = available + replaced
+
+    chunks = [(b, start, min(chunk_days, number_of_days - start))
+              for b in range(len(branches)) for start in range(0, number_of_days, chunk_days)]
+    seeds = [np.random.SeedSequence(root.entropy, spawn_key=(1, b, start // chunk_days)) for b, start, days in chunks]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) if workers > 1 else contextlib.nullcontext() as pool:
+        mapper = pool.map if workers > 1 else map
+        work = mapper(simulate_branch, [branches[b] for b, start, days in chunks],
+                      [in_service[b, start:start + days] for b, start, days in chunks], seeds,
+                      [engine] * len(chunks))
+        frames = []
+        for (b, start, days), daily in zip(chunks, work):
+            daily.insert(0, 'Branch', branches[b].name)
+            daily.insert(1, 'Day', np.arange(start, start + days))
+            daily.insert(2, 'Inventory qty', branches[b].fleet)
+            daily.insert(3, 'Computers available', in_service[b, start:start + days])
+            daily['Spares used'] = replaced[b, start:start + days]
+            daily['Repair cost'] = failures[b, start:start + days] * sim.REPAIR_COST
+            frames.append(daily)
+    detailed = pd.concat(frames, ignore_index=True)
+    return [detailed, summarize_branches(detailed, branches), summarize_system(detailed, spares)]
+
+
+def summarize_branches(detailed: pd.DataFrame, branches: list) -> pd.DataFrame:
+    """
+    :param detailed: DETAILED from run_network()
+    :param branches: The branches simulated
+    :return: Dataframe with one row per branch
+    """
+    by_branch = detailed.groupby('Branch', sort=False)
+    table = pd.DataFrame({'Fleet': [branch.fleet for branch in branches],
+                          'Hours open': [branch.hours_open for branch in branches],
+                          'Demand scale': [branch.demand_scale for branch in branches]},
+                         index=pd.Index([branch.name for branch in branches], name='Branch'))
+    table['Days'] = by_branch.size()
+    table['Patrons per day (median)'] = by_branch['Patrons today'].median()
+    table['Departed wait queue (median)'] = by_branch['Departed wait queue'].median()
+    table['Departed wait queue (max)'] = by_branch['Departed wait queue'].max()
+    table['median wait duration (median)'] = by_branch['median wait duration'].median()
+    table['max wait duration (max)'] = by_branch['max wait duration'].max()
+    table['Utilization (median)'] = by_branch['Utilization'].median()
+    table['Peak patrons waiting (max)'] = by_branch['Peak patrons waiting'].max()
+    table['Spares used per day (median)'] = by_branch['Spares used'].median()
+    table['Acquisition cost'] = table['Fleet'] * sim.ACQUISITION_COST
+    table['Median repair cost'] = by_branch['Repair cost'].median()
+    table['Total repair cost'] = by_branch['Repair cost'].sum()
+    return table
+
+
+def summarize_system(detailed: pd.DataFrame, spares: int = 0) -> pd.DataFrame:
+    """
+    :param detailed: DETAILED from run_network()
+    :param spares: Spare computers in the shared pool
+    :return: Dataframe of network-wide daily totals, one row per measure, min/median/max over days
+    """
+    detailed = detailed.assign(**{'Computers in use': detailed['Utilization'] * detailed['Computers available']})
+    by_day = detailed.groupby('Day')[['Inventory qty', 'Computers available', 'Computers in use', 'Patrons today',
+                                      'Departed wait queue', 'Peak patrons waiting', 'Spares used', 'Repair cost']].sum()
+    daily = pd.DataFrame({'Computers': by_day['Inventory qty'] + spares,
+                          'Computers available': by_day['Computers available'],
+                          'Patrons': by_day['Patrons today'],
+                          'Departed wait queue': by_day['Departed wait queue'],
+                          'Patrons waiting at branch peaks': by_day['Peak patrons waiting'],
+                          'Utilization': by_day['Computers in use'] / by_day['Computers available'],
+                          'Spares used': by_day['Spares used'],
+                          'Repair cost': by_day['Repair cost'],
+                          'Acquisition cost': (by_day['Inventory qty'] + spares) * sim.ACQUISITION_COST})
+    return daily.agg(['min', 'median', 'max']).T
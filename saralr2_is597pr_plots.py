@@ -0,0 +1,22 @@
+"""
+Plots for the library computer utilization simulation
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+matplotlib is only imported when a plot is drawn, so importing the simulation (and every worker process it starts)
+never loads matplotlib or a GUI backend.
+"""
+
+
+def show_histogram(values, bins: int = 200):
+    """
+    Show a density histogram, e.g. to check that a distribution looks like the CPL data.
+
+    :param values: Sequence of numbers
+    :param bins: Number of bins
+    :return: None
+    """
+    import matplotlib.pyplot as plt
+    plt.hist(values, bins=bins, density=True)
+    plt.show()
@@ -0,0 +1,243 @@
+"""
+Result sinks for the library computer utilization simulation
+Sara Rasmussen (saralr2)
+IS597PR
+Fall 2020
+
+A sink receives the simulation's result tables. Big tables (DETAILED) arrive as row groups through append(), one per
+chunk of days, while the simulation is still running; small aggregate tables arrive whole through write().
+- CsvSink: one CSV file per table, like main() always wrote.
+- NpzSink: one compressed zip archive of typed .npy column arrays per table; read_table() loads only the columns asked for.
+- ParquetSink: one Parquet file per table, one row group per append(); needs the optional pyarrow package.
+"""
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+
+def flatten_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn a result table into plain named columns: the index becomes a column and MultiIndex column names such as
+    ('Utilization 1', 'median') are joined with a space.
+
+    :param df: Result table
+    :return: Dataframe with a RangeIndex and string column names
+
+    >>> table = pd.DataFrame({('Utilization 1', 'min'): [.1, .2]}, index=pd.Index([75, 95], name='Inventory qty'))
+    >>> flatten_columns(table)
+       Inventory qty  Utilization 1 min
+    0             75                0.1
+    1             95                0.2
+    """
+    df = df.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [' '.join(str(level) for level in column) for column in df.columns]
+    if df.index.name is not None:
+        df = df.reset_index()
+    return df
+
+
+class CsvSink:
+    """
+    Write each table to <folder>/<name>.csv.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> sink = CsvSink(folder)
+    >>> sink.append('detailed_output', pd.DataFrame({'Inventory qty': [75, 75], 'Departed wait queue': [3, 0]}))
+    >>> sink.append('detailed_output', pd.DataFrame({'Inventory qty': [95], 'Departed wait queue': [1]}))
+    >>> sink.close()
+    >>> read_table(os.path.join(folder, 'detailed_output.csv'), columns=['Departed wait queue'])
+       Departed wait queue
+    0                    3
+    1                    0
+    2                    1
+    """
+    extension = '.csv'
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.rows_written = {}
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        """
+        :param name: Table name, e.g. 'detailed_output'
+        :return: File the table is written to
+        """
+        return os.path.join(self.folder, name + self.extension)
+
+    def append(self, name: str, df: pd.DataFrame):
+        """
+        Append one row group to a table, numbering rows on from the previous append.
+
+        :param name: Table name
+        :param df: Rows to append
+        :return: None
+        """
+        rows = self.rows_written.get(name, 0)
+        df = df.set_axis(range(rows, rows + len(df)))
+        df.to_csv(self.path(name), mode='a' if rows else 'w', header=not rows)
+        self.rows_written[name] = rows + len(df)
+
+    def write(self, name: str, df: pd.DataFrame):
+        """
+        Write a whole table at once.
+
+        :param name: Table name
+        :param df: Table
+        :return: None
+        """
+        df.to_csv(self.path(name))
+
+    def close(self):
+        """
+        Nothing to flush for CSV files.
+        """
+
+
+class NpzSink(CsvSink):
+    """
+    Write each table to <folder>/<name>.npz: a zip archive with one compressed .npy member per column and row group,
+    named '<column>/<row group #>.npy', plus the column order in 'columns.json'. Row groups are added to the archive
+    as they arrive, and read_table() decompresses only the columns it is asked for.
+
+    >>> import tempfile
+    >>> folder = tempfile.mkdtemp()
+    >>> sink = NpzSink(folder)
+    >>> for fleet in [75, 95]:
+    ...     sink.append('detailed_output', pd.DataFrame({'Inventory qty': [fleet] * 2, 'Utilization 1': [.25, .5]}))
+    >>> sink.close()
+    >>> table = read_table(os.path.join(folder, 'detailed_output.npz'), columns=['Utilization 1'])
+    >>> print(table['Utilization 1'].tolist(), table['Utilization 1'].dtype)
+    [0.25, 0.5, 0.25, 0.5] float64
+    >>> read_table(os.path.join(folder, 'detailed_output.npz'))['Inventory qty'].tolist()
+    [75, 75, 95, 95]
+    """
+    extension = '.npz'
+
+    def append(self, name: str, df: pd.DataFrame):
+        group = self.rows_written.get(name, 0)
+        mode = 'a' if group else 'w'
+        with zipfile.ZipFile(self.path(name), mode, compression=zipfile.ZIP_DEFLATED) as archive:
+            if not group:
+                archive.writestr('columns.json', json.dumps([str(column) for column in df.columns]))
+            for column in df.columns:
+                values = df[column].to_numpy()
+                if values.dtype == object:
+                    values = values.astype(str)
+                with archive.open(str(column) + '/' + str(group).zfill(6) + '.npy', 'w') as member:
+                    np.lib.format.write_array(member, values, allow_pickle=False)
+        self.rows_written[name] = group + 1     # Counts row groups
+
+    def write(self, name: str, df: pd.DataFrame):
+        self.rows_written[name] = 0
+        self.append(name, flatten_columns(df))
+
+
+class ParquetSink(CsvSink):
+    """
+    Write each table to <folder>/<name>.parquet, one row group per append(). Needs the optional pyarrow package.
+    """
+    extension = '.parquet'
+
+    def __init__(self, folder: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("ParquetSink needs pyarrow: pip install pyarrow")
+        super().__init__(folder)
+        self.pa = pyarrow
+        self.writers = {}
+
+    def append(self, name: str, df: pd.DataFrame):
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if name not in self.writers:
+            self.writers[name] = self.pa.parquet.ParquetWriter(self.path(name), table.schema, compression='zstd')
+        self.writers[name].write_table(table)
+
+    def write(self, name: str, df: pd.DataFrame):
+        self.pa.parquet.write_table(self.pa.Table.from_pandas(flatten_columns(df), preserve_index=False),
+                                    self.path(name), compression='zstd')
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+SINKS = {'csv': CsvSink, 'npz': NpzSink, 'parquet': ParquetSink}
+
+
+def open_sink(output_format: str, folder: str) -> CsvSink:
+    """
+    :param output_format: 'csv', 'npz' or 'parquet'
+    :param folder: Folder to write the tables to
+    :return: A new sink of that format
+
+    >>> open_sink('xlsx', 'sample_output/')
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown output format 'xlsx'; choose one of ['csv', 'npz', 'parquet']
+    """
+    if output_format not in SINKS:
+        raise ValueError("Unknown output format '" + output_format + "'; choose one of " + str(list(SINKS)))
+    return SINKS[output_format](folder)
+
+
+def read_table(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Read a table written by any sink, loading only the columns asked for from .npz and .parquet files.
+
+    Every format gives the same Dataframe: aggregate tables come back with flatten_columns() names and their index as
+    a column, as NpzSink and ParquetSink store them, including the two header rows CsvSink writes for two levels of
+    column names.
+
+    :param path: File written by a sink
+    :param columns: Optional list of column names to load; all columns if None
+    :return: Dataframe
+
+    >>> import tempfile
+    >>> sink = CsvSink(tempfile.mkdtemp())
+    >>> sink.write('patron_departures', pd.DataFrame({('Departed wait queue', 'median'): [18.5, 4.0]},
+    ...                                              index=pd.Index([75, 95], name='Inventory qty')))
+    >>> read_table(sink.path('patron_departures'), columns=['Inventory qty', 'Departed wait queue median'])
+       Inventory qty  Departed wait queue median
+    0             75                        18.5
+    1             95                         4.0
+    >>> sink.write('financial_overview', pd.DataFrame({'Total cost': [28600, 36195]}, index=pd.Index([75, 95], name='Inventory qty')))
+    >>> read_table(sink.path('financial_overview'), columns=['Inventory qty', 'Total cost'])
+       Inventory qty  Total cost
+    0             75       28600
+    1             95       36195
+    """
+    if path.endswith('.npz'):
+        with zipfile.ZipFile(path) as archive:
+            if columns is None:
+                columns = json.loads(archive.read('columns.json'))
+            members = sorted(archive.namelist())
+            data = {}
+            for column in columns:
+                groups = [member for member in members if member.startswith(column + '/')]
+                if not groups:
+                    raise KeyError(column)
+                data[column] = np.concatenate([np.lib.format.read_array(archive.open(member)) for member in groups])
+        return pd.DataFrame(data)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(path, columns=columns).to_pandas()
+    header = pd.read_csv(path, header=None, nrows=3)
+    if len(header) == 3 and pd.isna(header.iloc[0, 0]) and header.iloc[2, 1:].isna().all():
+        # Second header row of column names, then a row holding only the index name
+        table = flatten_columns(pd.read_csv(path, header=[0, 1], index_col=0))
+        return table if columns is None else table[list(columns)]
+    usecols = None
+    if columns is not None:
+        index_column = pd.read_csv(path, nrows=0).columns[0]     # Keep the index column
+        usecols = [index_column] + [column for column in columns if column != index_column]
+    # A named index, e.g. 'Inventory qty', becomes a column as in the other formats
+    table = flatten_columns(pd.read_csv(path, index_col=0, usecols=usecols))
+    return table if columns is None else table[list(columns)]